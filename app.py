@@ -1,16 +1,50 @@
-import config
-from celery import Celery
+import os
+
 from src import create_app
 
-celery = Celery(
-    __name__,
-    backend='redis://localhost:6379/0',
-    broker='redis://localhost:6379/0',
-)
+app = create_app(os.getenv('APP_ENV', 'development'))
+
+_celery = None
+
+
+def make_celery():
+    """Celery app for the workers and for publishing tasks
+
+    Created on first access to `app.celery`, so web processes that never
+    touch a task do not import Celery.
+    """
+    from celery import Celery
+    celery = Celery(
+        __name__,
+        backend='redis://localhost:6379/0',
+        broker='redis://localhost:6379/0',
+        include=['src.tasks.maintenance', 'src.tasks.email_outbox'],
+    )
+
+    celery.conf.update(app.config)
+    if app.config['TRACING_ENABLED']:
+        from src.services.tracing import tracer
+        tracer.init_celery(celery)
+    celery.conf.beat_schedule = {
+        'prune-expired': {
+            'task': 'src.tasks.maintenance.prune_expired',
+            'schedule': app.config['PRUNE_INTERVAL'],
+        },
+        'drain-email-outbox': {
+            'task': 'src.tasks.email_outbox.drain_email_outbox',
+            'schedule': app.config['EMAIL_OUTBOX_DRAIN_INTERVAL'],
+        },
+    }
+    return celery
 
-app = create_app(config.DevelopmentConfig)
 
-celery.conf.update(app.config)
+def __getattr__(name):
+    global _celery
+    if name == 'celery':
+        if _celery is None:
+            _celery = make_celery()
+        return _celery
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 @app.route("/")
@@ -23,21 +57,13 @@ def make_shell_context():
     """Adds imports to default shell context for easier use"""
     from src.models.users import UserModel
     from src.models.revoked_tokens import RevokedTokenModel
+    from src.models.email_outbox import EmailOutboxModel
     return {
         "user": UserModel,
         "revoked_token": RevokedTokenModel,
+        "email_outbox": EmailOutboxModel,
     }
 
 
-from src.services.jwt import jwt
-
-
-@jwt.token_in_blacklist_loader
-def check_if_token_in_blacklist(decrypted_token):
-    from src.models.revoked_tokens import RevokedTokenModel
-    jti = decrypted_token['jti']
-    return RevokedTokenModel.is_jti_blacklisted(jti)
-
-
 if __name__ == '__main__':
     app.run(debug=True)
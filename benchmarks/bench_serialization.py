@@ -0,0 +1,85 @@
+"""Per-request CPU of the /api/users/ response path, old versus new
+
+The old path dumped users to a JSON string with marshmallow, parsed it
+back with json.loads and let make_response encode it a second time
+(pretty printed). The new path serialises models once through the
+precompiled UserSchema serializer and encodes the envelope in one pass.
+
+    python -m benchmarks.bench_serialization --users 50 --iterations 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MYSQL_HOST', 'localhost')
+
+
+def make_users(count):
+    from src.models.users import UserModel, UserRole
+    return [
+        UserModel(
+            id=i,
+            email=f"user{i}@example.com",
+            role=UserRole.USER,
+            first_name="First",
+            last_name="Last",
+            phone_number="(234)567-8901",
+            verified=True,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def old_path(users):
+    from flask import make_response
+    from src.schemas.users import UserSchema
+    result = UserSchema().dumps(users, many=True)
+    response = json.loads(result)
+    return make_response({'error': False, 'data': response}, 200)
+
+
+def new_path(users):
+    from src.schemas.users import UserSchema
+    from src.utils.api_response import APIResponse
+    return APIResponse.paginated_200(users, None, schema=UserSchema)
+
+
+def measure(fn, users, iterations):
+    fn(users)
+    started = time.process_time()
+    for _ in range(iterations):
+        fn(users)
+    return (time.process_time() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    import config
+    from src import create_app
+
+    class BenchConfig(config.DevelopmentConfig):
+        HASH_ROUNDS = 1000
+
+    app = create_app(BenchConfig)
+    users = make_users(args.users)
+
+    with app.test_request_context('/api/users/'):
+        app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+        old = measure(old_path, users, args.iterations)
+        new = measure(new_path, users, args.iterations)
+
+    print(f"users per response: {args.users}")
+    print(f"old path: {old * 1e6:9.1f} us CPU/request")
+    print(f"new path: {new * 1e6:9.1f} us CPU/request")
+    print(f"saved:    {(old - new) * 1e6:9.1f} us CPU/request ({(1 - new / old) * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
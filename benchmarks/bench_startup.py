@@ -0,0 +1,173 @@
+"""Cold start cost of building the app, eager versus LAZY_STARTUP
+
+Each run is a fresh interpreter started with `python -X importtime` that
+imports `src`, builds the app with create_app and serves one request
+(GET /api/users/ without a token, which needs no database). Startup is
+reported as the wall time to build the app, the time of that first
+request (where lazy resources are imported), the total import time
+from -X importtime, the number of modules loaded by create_app, and the
+slowest top-level imports. Known heavy dependencies loaded by create_app
+are listed, so a stray eager import of flasgger, Celery or boto3 shows up.
+Build time includes password hashing calibration and pool warm-up unless
+HASH_ROUNDS is set in the environment.
+
+Results are compared with the JSON baseline (benchmarks/baselines/
+startup.json by default) and the run fails when a mode's median build
+time or import time grows by more than `--threshold`, or when it starts
+loading a heavy dependency it did not load before. Baselines are machine
+specific; the committed one only documents the machine it names.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 5 --save-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(ROOT, 'benchmarks', 'baselines')
+MODES = {'eager': 'false', 'lazy': 'true'}
+HEAVY_MODULES = ('flasgger', 'celery', 'boto3', 'botocore', 'alembic', 'flask_migrate', 'src.resources')
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from src import create_app
+app = create_app('development')
+built = time.perf_counter()
+modules = sorted(sys.modules)
+app.test_client().get('/api/users/')
+served = time.perf_counter()
+print(json.dumps({
+    'build_ms': (built - started) * 1000,
+    'first_request_ms': (served - built) * 1000,
+    'modules': modules,
+}))
+"""
+
+
+def run_probe(lazy):
+    env = dict(os.environ)
+    env.setdefault('MYSQL_HOST', 'localhost')
+    env.setdefault('MYSQL_PORT', '3306')
+    env['LAZY_STARTUP'] = lazy
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    top_level = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        # One space of indent marks a module imported directly by the probe.
+        if match and len(match.group(3)) == 1:
+            top_level[match.group(4)] = int(match.group(2)) / 1000
+    result['import_ms'] = sum(top_level.values())
+    result['top_imports'] = top_level
+    return result
+
+
+def measure(mode, runs, top):
+    # The first run compiles bytecode; it is not a cold start worth timing.
+    run_probe(MODES[mode])
+    samples = [run_probe(MODES[mode]) for _ in range(runs)]
+
+    top_imports = {}
+    for sample in samples:
+        for name, ms in sample['top_imports'].items():
+            top_imports.setdefault(name, []).append(ms)
+    slowest = sorted(top_imports.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:top]
+
+    modules = samples[-1]['modules']
+    return {
+        'build_ms': round(statistics.median(s['build_ms'] for s in samples), 1),
+        'first_request_ms': round(statistics.median(s['first_request_ms'] for s in samples), 1),
+        'import_ms': round(statistics.median(s['import_ms'] for s in samples), 1),
+        'modules': len(modules),
+        'heavy_modules': sorted({
+            heavy for heavy in HEAVY_MODULES
+            for name in modules if name == heavy or name.startswith(heavy + '.')
+        }),
+        'top_imports': {name: round(statistics.median(ms), 1) for name, ms in slowest},
+    }
+
+
+def compare(result, baseline, threshold):
+    regressions = []
+    for mode, current in result['modes'].items():
+        previous = baseline.get('modes', {}).get(mode)
+        if previous is None:
+            continue
+        for key in ('build_ms', 'import_ms'):
+            if current[key] > previous[key] * (1 + threshold):
+                regressions.append(f"{mode}: {key} {previous[key]} -> {current[key]}")
+        added = sorted(set(current['heavy_modules']) - set(previous['heavy_modules']))
+        if added:
+            regressions.append(f"{mode}: now imports {', '.join(added)}")
+    return regressions
+
+
+def print_report(result):
+    for mode, stats in result['modes'].items():
+        print(f"{mode}: build {stats['build_ms']} ms, first request {stats['first_request_ms']} ms, "
+              f"imports {stats['import_ms']} ms, {stats['modules']} modules")
+        print(f"  heavy modules: {', '.join(stats['heavy_modules']) or '-'}")
+        for name, ms in stats['top_imports'].items():
+            print(f"  {ms:>9} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mode', choices=tuple(MODES), action='append', help='defaults to every mode')
+    parser.add_argument('--top', type=int, default=10, help='slowest top-level imports to list')
+    parser.add_argument('--baseline', help='baseline JSON file to compare against and save to')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--output', help='also write the result JSON here')
+    args = parser.parse_args()
+
+    result = {
+        'runs': args.runs,
+        'python': sys.version.split()[0],
+        'machine': f"{platform.platform()}, {platform.python_version()}, {os.cpu_count()} CPUs",
+        'modes': {mode: measure(mode, args.runs, args.top) for mode in args.mode or MODES},
+    }
+
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, 'startup.json')
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"baseline saved to {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"no baseline at {baseline_path}; run with --save-baseline to record one")
+        return 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get('machine') != result['machine']:
+        print(f"note: baseline was recorded on {baseline.get('machine', 'an unknown machine')}; "
+              f"timings are only comparable on the same machine")
+    regressions = compare(result, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Shared setup for the API benchmarks
+
+Builds the app through create_app against an in-memory SQLite database, a
+SQLite file (needed when a separate server process is involved) or any
+database URI such as a local MySQL, seeds users, and drives the user flow
+through either the Flask test client or HTTP. Query counts come from the
+query profiler's Server-Timing header, so both drivers report them.
+"""
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MYSQL_HOST', 'localhost')
+
+PASSWORD = 'bench-password'
+ENDPOINTS = ('sign_in', 'refresh', 'profile_get', 'profile_update', 'users_list', 'sign_out')
+QUERY_COUNT = re.compile(r'desc="(\d+) queries"')
+
+
+def bench_config(database_uri, hash_rounds, workdir):
+    import config
+
+    class BenchConfig(config.DevelopmentConfig):
+        DEBUG = False
+        SECRET_KEY = 'bench-secret'
+        JWT_SECRET_KEY = 'bench-jwt-secret'
+        SECURITY_PASSWORD_SALT = 'bench-salt'
+        SQLALCHEMY_DATABASE_URI = database_uri
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        SES_STUB = True
+        HASH_ROUNDS = hash_rounds
+        HASH_POOL_WORKERS = 0
+        HASH_POOL_LOCK_DIR = os.path.join(workdir, 'hash-slots')
+        REVOCATION_INDEX_PATH = os.path.join(workdir, 'revoked.bloom')
+        QUERY_PROFILER_ENABLED = True
+        QUERY_PROFILER_SLOW_REQUEST_MS = float('inf')
+        QUERY_PROFILER_SLOW_QUERY_MS = float('inf')
+        QUERY_PROFILER_REPEAT_THRESHOLD = 1000000
+        METRICS_ENABLED = False
+        TRACING_ENABLED = False
+
+    return BenchConfig
+
+
+def build_app(database_uri=None, hash_rounds=1000, workdir=None):
+    from src import create_app
+    workdir = workdir or tempfile.mkdtemp(prefix='flapisk-bench-')
+    return create_app(bench_config(database_uri or 'sqlite://', hash_rounds, workdir))
+
+
+def seed_users(app, count):
+    """Create `count` verified users sharing one password; returns their emails"""
+    from datetime import datetime
+    from src.models.users import UserModel, UserRole
+    from src.services.db import db
+    from src.utils.hash import compute_hash
+
+    emails = [f"bench{i}@example.com" for i in range(count)]
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password_hash = compute_hash(PASSWORD)
+        now = datetime.utcnow()
+        db.session.bulk_insert_mappings(UserModel, [
+            {
+                'email': email,
+                'password': password_hash,
+                'role': UserRole.USER,
+                'first_name': 'Bench',
+                'last_name': 'User',
+                'verified': True,
+                'verified_at': now,
+                'active': True,
+                'token_generation': 0,
+                'created_at': now,
+                'updated_at': now,
+            }
+            for email in emails
+        ])
+        db.session.commit()
+    return emails
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Authorization': f"Bearer {token}"} if token else {}
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, headers=headers, json=body)
+        elapsed = time.perf_counter() - started
+        return response.status_code, response.headers.get('Server-Timing', ''), response.get_json(silent=True), elapsed
+
+
+class HTTPDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req) as response:
+                status, timing, payload = response.status, response.headers.get('Server-Timing', ''), response.read()
+        except urllib.error.HTTPError as e:
+            status, timing, payload = e.code, e.headers.get('Server-Timing', ''), e.read()
+        elapsed = time.perf_counter() - started
+        try:
+            payload = json.loads(payload) if payload else None
+        except ValueError:
+            payload = None
+        return status, timing, payload, elapsed
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.queries = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+
+    def call(self, driver, name, method, path, token=None, body=None, expect=200):
+        status, timing, payload, elapsed = driver.request(method, path, token, body)
+        self.latencies[name].append(elapsed)
+        match = QUERY_COUNT.search(timing)
+        if match:
+            self.queries[name].append(int(match.group(1)))
+        if status != expect:
+            self.errors[name] += 1
+        return payload
+
+    def merge(self, other):
+        for name in ENDPOINTS:
+            self.latencies[name].extend(other.latencies[name])
+            self.queries[name].extend(other.queries[name])
+            self.errors[name] += other.errors[name]
+
+
+def run_flow(driver, recorder, email):
+    """Sign in, refresh, read and update the profile, list users, sign out"""
+    tokens = recorder.call(driver, 'sign_in', 'POST', '/api/auth/sign-in',
+                           body={'email': email, 'password': PASSWORD})
+    if not tokens or tokens.get('error'):
+        return
+    access, refresh = tokens['data']['access_token'], tokens['data']['refresh_token']
+
+    refreshed = recorder.call(driver, 'refresh', 'POST', '/api/auth/refresh', token=refresh)
+    if refreshed and not refreshed.get('error'):
+        access = refreshed['data']['access_token']
+
+    recorder.call(driver, 'profile_get', 'GET', '/api/profile', token=access)
+    recorder.call(driver, 'profile_update', 'PUT', '/api/profile', token=access,
+                  body={'email': email, 'first_name': 'Bench', 'last_name': 'Updated'})
+    recorder.call(driver, 'users_list', 'GET', '/api/users/?limit=50', token=access)
+    recorder.call(driver, 'sign_out', 'POST', '/api/auth/sign-out', token=access, expect=204)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarise(recorder, wall_seconds, flows):
+    endpoints = {}
+    for name in ENDPOINTS:
+        samples = recorder.latencies[name]
+        if not samples:
+            continue
+        queries = recorder.queries[name]
+        endpoints[name] = {
+            'count': len(samples),
+            'errors': recorder.errors[name],
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+            'queries': round(sum(queries) / len(queries), 2) if queries else None,
+        }
+    requests = sum(len(samples) for samples in recorder.latencies.values())
+    return {
+        'flows': flows,
+        'requests': requests,
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput_rps': round(requests / wall_seconds, 1) if wall_seconds else None,
+        'endpoints': endpoints,
+    }
+
+
+def machine():
+    """Label for the machine a result was recorded on; baselines only compare on the same one"""
+    return f"{platform.platform()}, {platform.python_version()}, {os.cpu_count()} CPUs"
+
+
+def compare(result, baseline, threshold):
+    """Regressions of `result` against `baseline`, as readable strings"""
+    regressions = []
+    for name, current in result['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        # Query counts are averages (cached lookups skip queries), so allow noise below one query.
+        if current['queries'] is not None and previous['queries'] is not None \
+                and current['queries'] > previous['queries'] + 0.5:
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+    if baseline.get('throughput_rps') and result['throughput_rps'] is not None \
+            and result['throughput_rps'] < baseline['throughput_rps'] * (1 - threshold):
+        regressions.append(f"throughput {baseline['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return regressions
+
+
+def print_report(result):
+    print(f"{'endpoint':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'errors':>8}")
+    for name, stats in result['endpoints'].items():
+        queries = '-' if stats['queries'] is None else stats['queries']
+        print(f"{name:<16}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{queries:>9}{stats['errors']:>8}")
+    print(f"throughput: {result['throughput_rps']} req/s over {result['wall_seconds']} s")
@@ -5,20 +5,29 @@ from dotenv import load_dotenv
 logger = logging.getLogger(__name__)
 
 
+def load_environment():
+    if 'MYSQL_HOST' not in os.environ:
+        dotenv_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '.env.development')
+        load_dotenv(dotenv_path)
+
+
+# Config values are read when this module is first imported, not when
+# create_app runs, so .env.development has to be loaded here. Importing
+# config costs only os.getenv calls and happens once, inside create_app.
+load_environment()
+
+
 class DevelopmentConfig(object):
     BASE_DIR = os.path.dirname(os.path.realpath(__file__))
     TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
-    if 'MYSQL_HOST' not in os.environ:
-        dotenv_path = os.path.join(BASE_DIR, '.env.development')
-        load_dotenv(dotenv_path)
-
     SYS_CONFIG_DIR = os.getenv('SYS_CONFIG_DIR')
 
     """Application configuration"""
     SECRET_KEY = os.getenv('SECRET_KEY')
-    JSONIFY_PRETTYPRINT_REGULAR = True
+    JSONIFY_PRETTYPRINT_REGULAR = False
     DEBUG = True
+    LAZY_STARTUP = os.getenv('LAZY_STARTUP', '').lower() in ('1', 'true', 'yes')
 
     """SQLAlchemy configuration"""
     SQLALCHEMY_DATABASE_URI = 'mysql+pymysql://{USER}:{PASSWORD}@{HOST}:{PORT}/{DATABASE}'.format(
@@ -30,6 +39,45 @@ class DevelopmentConfig(object):
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = True
 
+    """API documentation"""
+    SWAGGER_ENABLED = os.getenv('SWAGGER_ENABLED', 'false' if LAZY_STARTUP else 'true').lower() in ('1', 'true', 'yes')
+    DOCS_DIR = os.getenv('DOCS_DIR', os.path.join(BASE_DIR, 'static', 'docs'))
+    DOCS_MAX_AGE = int(os.getenv('DOCS_MAX_AGE', 300))
+
+    """Metrics configuration"""
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+    METRICS_CELERY_BROKER_URL = os.getenv('METRICS_CELERY_BROKER_URL', 'redis://localhost:6379/0')
+    # Scrapers allowed without METRICS_TOKEN: comma-separated addresses or networks
+    METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    """Tracing configuration"""
+    TRACING_ENABLED = os.getenv('TRACING_ENABLED', '').lower() in ('1', 'true', 'yes')
+    TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', 0.01))
+    # Follow the sampled flag of incoming traceparent headers (trusted callers only)
+    TRACING_TRUST_TRACEPARENT = os.getenv('TRACING_TRUST_TRACEPARENT', '').lower() in ('1', 'true', 'yes')
+    TRACING_FILE = os.getenv('TRACING_FILE', '/tmp/flapisk-traces/traces.jsonl')
+    TRACING_EXPORTER = os.getenv('TRACING_EXPORTER')
+
+    """Diagnostics configuration"""
+    DIAGNOSTICS_DIR = os.getenv('DIAGNOSTICS_DIR', '/tmp/flapisk-diagnostics')
+    DIAGNOSTICS_MAX_SECONDS = int(os.getenv('DIAGNOSTICS_MAX_SECONDS', 60))
+    DIAGNOSTICS_SAMPLE_INTERVAL_MS = float(os.getenv('DIAGNOSTICS_SAMPLE_INTERVAL_MS', 10))
+
+    """Query profiler configuration"""
+    QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', '').lower() in ('1', 'true', 'yes')
+    QUERY_PROFILER_SLOW_REQUEST_MS = float(os.getenv('QUERY_PROFILER_SLOW_REQUEST_MS', 500))
+    QUERY_PROFILER_SLOW_QUERY_MS = float(os.getenv('QUERY_PROFILER_SLOW_QUERY_MS', 100))
+    QUERY_PROFILER_REPEAT_THRESHOLD = int(os.getenv('QUERY_PROFILER_REPEAT_THRESHOLD', 5))
+    QUERY_PROFILER_TOP_QUERIES = int(os.getenv('QUERY_PROFILER_TOP_QUERIES', 3))
+
+    """Read replica configuration"""
+    DATABASE_REPLICA_URIS = [uri for uri in os.getenv('DATABASE_REPLICA_URIS', '').split(',') if uri]
+    REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+    REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 2))
+    REPLICA_CHECK_INTERVAL = int(os.getenv('REPLICA_CHECK_INTERVAL', 5))
+
     """JWT configuration"""
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = 60 * 60 * 24 * 7
@@ -38,18 +86,68 @@ class DevelopmentConfig(object):
     JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
     PROPAGATE_EXCEPTIONS = True
 
+    """Token revocation index"""
+    REVOCATION_INDEX_PATH = os.getenv('REVOCATION_INDEX_PATH', '/tmp/flapisk-revoked.bloom')
+    REVOCATION_BLOOM_BITS = int(os.getenv('REVOCATION_BLOOM_BITS', 1 << 23))
+    REVOCATION_BLOOM_HASHES = int(os.getenv('REVOCATION_BLOOM_HASHES', 7))
+    # Longest a worker goes without seeing tokens revoked on other hosts
+    REVOCATION_SYNC_INTERVAL = float(os.getenv('REVOCATION_SYNC_INTERVAL', 5))
+    REVOCATION_REBUILD_INTERVAL = int(os.getenv('REVOCATION_REBUILD_INTERVAL', 60 * 60))
+    TOKEN_GENERATION_CACHE_SIZE = int(os.getenv('TOKEN_GENERATION_CACHE_SIZE', 10000))
+    TOKEN_GENERATION_CACHE_TTL = int(os.getenv('TOKEN_GENERATION_CACHE_TTL', 30))
+
+    """User cache"""
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 30))
+    USER_CACHE_SHARED_TTL = int(os.getenv('USER_CACHE_SHARED_TTL', 300))
+    USER_CACHE_BACKEND = os.getenv('USER_CACHE_BACKEND')
+
+    """Password hashing pool"""
+    # Unset splits the CPUs between uWSGI workers; 0 hashes inline
+    HASH_POOL_WORKERS = os.getenv('HASH_POOL_WORKERS')
+    HASH_POOL_QUEUE_SIZE = int(os.getenv('HASH_POOL_QUEUE_SIZE', (os.cpu_count() or 1) * 2))
+    HASH_POOL_TIMEOUT = float(os.getenv('HASH_POOL_TIMEOUT', 5))
+    HASH_POOL_MAP_CHUNK = int(os.getenv('HASH_POOL_MAP_CHUNK', (os.cpu_count() or 1) * 4))
+    HASH_ROUNDS = os.getenv('HASH_ROUNDS')
+    HASH_TARGET_VERIFY_MS = float(os.getenv('HASH_TARGET_VERIFY_MS', 50))
+    HASH_MIN_ROUNDS = int(os.getenv('HASH_MIN_ROUNDS', 29000))
+    HASH_ROUNDS_TOLERANCE = float(os.getenv('HASH_ROUNDS_TOLERANCE', 0.25))
+
+    """Pagination configuration"""
+    PAGINATION_DEFAULT_LIMIT = 50
+    PAGINATION_MAX_LIMIT = 500
+    PAGINATION_COUNT_CACHE_TTL = int(os.getenv('PAGINATION_COUNT_CACHE_TTL', 60))
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+    USER_BULK_MAX_OPERATIONS = int(os.getenv('USER_BULK_MAX_OPERATIONS', 10000))
+
+    """Maintenance configuration"""
+    PRUNE_INTERVAL = int(os.getenv('PRUNE_INTERVAL', 60 * 60))
+    PRUNE_BATCH_SIZE = int(os.getenv('PRUNE_BATCH_SIZE', 1000))
+    PRUNE_BATCH_PAUSE = float(os.getenv('PRUNE_BATCH_PAUSE', 0.1))
+    UNVERIFIED_USER_TTL = int(os.getenv('UNVERIFIED_USER_TTL', 60 * 60 * 24 * 7))
+
     """AWS configuration"""
     AWS_REGION = os.getenv('AWS_REGION')
     AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 
 
+    """Email outbox"""
+    SES_STUB = os.getenv('SES_STUB', '').lower() in ('1', 'true', 'yes')
+    SES_MAX_POOL_CONNECTIONS = int(os.getenv('SES_MAX_POOL_CONNECTIONS', 10))
+    MAIL_TEMPLATE_CACHE_DIR = os.getenv('MAIL_TEMPLATE_CACHE_DIR')
+    EMAIL_OUTBOX_DRAIN_INTERVAL = float(os.getenv('EMAIL_OUTBOX_DRAIN_INTERVAL', 5))
+    EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 50))
+    EMAIL_OUTBOX_MAX_BATCHES = int(os.getenv('EMAIL_OUTBOX_MAX_BATCHES', 20))
+    EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
+    EMAIL_OUTBOX_RETRY_BACKOFF = int(os.getenv('EMAIL_OUTBOX_RETRY_BACKOFF', 30))
+    EMAIL_OUTBOX_RETRY_BACKOFF_MAX = int(os.getenv('EMAIL_OUTBOX_RETRY_BACKOFF_MAX', 60 * 60))
+    EMAIL_OUTBOX_CLAIM_TIMEOUT = int(os.getenv('EMAIL_OUTBOX_CLAIM_TIMEOUT', 5 * 60))
+    EMAIL_OUTBOX_RETENTION = int(os.getenv('EMAIL_OUTBOX_RETENTION', 60 * 60 * 24 * 7))
+
     """Tmp path"""
     TMP_UPLOAD_PATH = "/tmp/upload/"
-    os.makedirs(TMP_UPLOAD_PATH, exist_ok=True)
-
     TMP_DOWNLOAD_PATH = "/tmp/download/"
-    os.makedirs(TMP_DOWNLOAD_PATH, exist_ok=True)
 
     SECURITY_PASSWORD_SALT = os.getenv('SECURITY_PASSWORD_SALT')
 
@@ -58,5 +156,33 @@ class DevelopmentConfig(object):
     SERVICE_EMAIL = os.getenv('SERVICE_EMAIL')
 
 
-class ProductionConfig(object):
+class ProductionConfig(DevelopmentConfig):
     DEBUG = False
+
+    """API documentation"""
+    # By default only the spec prebuilt by `flask docs build` is served.
+    SWAGGER_ENABLED = os.getenv('SWAGGER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+    """SQLAlchemy configuration"""
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        # Below MySQL's wait_timeout, so idle connections are replaced
+        # before the server drops them.
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 280)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    }
+    DB_POOL_WARMUP = int(os.getenv('DB_POOL_WARMUP', 2))
+
+
+def get_config(name):
+    """Config class for an environment name such as 'production'"""
+    configs = {
+        'development': DevelopmentConfig,
+        'production': ProductionConfig,
+    }
+    if name not in configs:
+        raise ValueError(f"Unknown config {name!r}; expected one of {', '.join(configs)}")
+    return configs[name]
@@ -1,31 +1,68 @@
 """Flask app config and initialization"""
 import logging.config
+import os
 from flask import Flask
 
 
 def create_app(config_obj=None):
+    """Build the app from a config class or a config name such as 'production'
+
+    With LAZY_STARTUP, resource modules are imported on their first request,
+    the Swagger docs are off unless SWAGGER_ENABLED is set, migrations and
+    CLI commands are skipped, password hashing is calibrated on the first
+    hash and the connection pool is not warmed up. Under the `flask` command
+    the app is always fully loaded.
+    """
     app = Flask(__name__)
 
     if not config_obj:
         logging.warning("No config specified; defaulting to development")
+        config_obj = 'development'
 
+    if isinstance(config_obj, str):
         import config
-        config_obj = config.DevelopmentConfig
+        config_obj = config.get_config(config_obj)
 
     app.config.from_object(config_obj)
+    app.config.setdefault('LAZY_STARTUP', False)
+    # Migrations, CLI commands and the docs build need every resource loaded.
+    if os.getenv('FLASK_RUN_FROM_CLI'):
+        app.config['LAZY_STARTUP'] = False
+    lazy = app.config['LAZY_STARTUP']
+    os.makedirs(app.config['TMP_UPLOAD_PATH'], exist_ok=True)
+    os.makedirs(app.config['TMP_DOWNLOAD_PATH'], exist_ok=True)
 
     # CORS allow
     from flask_cors import CORS
     cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+    # Metrics
+    from src.services.metrics import metrics
+    metrics.init_app(app)
+
+    # Tracing
+    from src.services.tracing import tracer
+    tracer.init_app(app)
+
     # DB service
-    from src.services.db import db
+    from src.services.db import db, replica_router, pool_monitor
+    replica_router.init_app(app)
     db.init_app(app)
     db.app = app
+    pool_monitor.init_app(app)
+
+    # Models are registered up front, so the metadata seen by create_all and
+    # migrations is complete even when resources are imported lazily
+    from src.models import users, revoked_tokens, email_outbox  # noqa: F401
+
+    # Query profiler
+    from src.services.profiler import query_profiler
+    query_profiler.init_app(app)
 
     # Migration service
-    from src.services.migrate import migrate
-    migrate.init_app(app, db)
+    if not lazy:
+        from src.services.migrate import migrate
+        migrate.init_app(app, db)
 
     # Marshmallow service
     from src.services.marshmallow import ma
@@ -35,37 +72,83 @@ def create_app(config_obj=None):
     from src.services.jwt import jwt
     jwt.init_app(app)
 
+    # Token revocation index
+    from src.services.revocation import revocation_index, token_generations
+    revocation_index.init_app(app)
+    token_generations.init_app(app)
+
+    # Entity cache
+    from src.services.cache import user_cache
+    user_cache.init_app(app)
+
+    # Password hashing pool
+    from src.services.hasher import hasher
+    hasher.init_app(app)
+
+    from src.utils.hash import configure_hashing
+    configure_hashing(app, defer=lazy)
+
+    # Email service
+    from src.services.mailer import mailer
+    mailer.init_app(app)
+
     from src.services.flagger import swagger
     swagger.init_app(app)
 
     # Router service
     from src.routes import api_router
     api_router.init_app(app)
-
-    from src.resources.auth import SignInResource, SignUpResource, SignOutResource, TokenRefreshResource, \
-        UserVerifyResource, ResendVerifyEmailResource, UpdateEmailResource
-    api_router.add_resource(SignInResource, "/auth/sign-in")
-    api_router.add_resource(SignUpResource, "/auth/sign-up")
-    api_router.add_resource(SignOutResource, "/auth/sign-out")
-    api_router.add_resource(TokenRefreshResource, "/auth/refresh")
-    api_router.add_resource(UserVerifyResource, "/auth/verify/<verifyToken>", methods=['GET'])
-    api_router.add_resource(ResendVerifyEmailResource, "/auth/email-resend/<email>", methods=['GET'])
-    api_router.add_resource(UpdateEmailResource, "/auth/email-update/<old_email>/<new_email>", methods=['GET'])
-
-    from src.resources.profile import GetProfileResource, UpdateProfileResource, \
-        PasswordResetResource, CloseProfileResource
-    api_router.add_resource(GetProfileResource, "/profile", methods=['GET'])
-    api_router.add_resource(UpdateProfileResource, "/profile", methods=['PUT'])
-    api_router.add_resource(PasswordResetResource, "/profile/password-reset", methods=['POST'])
-    api_router.add_resource(CloseProfileResource, "/profile/close", methods=['POST'])
-
-    from src.resources.users import GetUserResource, GetUsersResource, \
-        UpdateUserResource, DeleteUserResource
-    api_router.add_resource(GetUsersResource, "/users/", methods=['GET'])
-    api_router.add_resource(GetUserResource, "/users/<id>", methods=['GET'])
-    api_router.add_resource(UpdateUserResource, "/users/<id>", methods=['PUT'])
-    api_router.add_resource(DeleteUserResource, "/users/<id>", methods=['DELETE'])
+    api_router.add_decorator(metrics.track_resource)
+    api_router.add_decorator(tracer.trace_resource)
+
+    api_router.add_resource("src.resources.auth:SignInResource", "/auth/sign-in", methods=['POST'])
+    api_router.add_resource("src.resources.auth:SignUpResource", "/auth/sign-up", methods=['POST'])
+    api_router.add_resource("src.resources.auth:SignOutResource", "/auth/sign-out", methods=['POST'])
+    api_router.add_resource("src.resources.auth:TokenRefreshResource", "/auth/refresh", methods=['POST'])
+    api_router.add_resource("src.resources.auth:UserVerifyResource", "/auth/verify/<verifyToken>", methods=['GET'])
+    api_router.add_resource("src.resources.auth:ResendVerifyEmailResource", "/auth/email-resend/<email>",
+                            methods=['GET'])
+    api_router.add_resource("src.resources.auth:UpdateEmailResource", "/auth/email-update/<old_email>/<new_email>",
+                            methods=['GET'])
+
+    api_router.add_resource("src.resources.profile:GetProfileResource", "/profile", methods=['GET'])
+    api_router.add_resource("src.resources.profile:UpdateProfileResource", "/profile", methods=['PUT'])
+    api_router.add_resource("src.resources.profile:PasswordResetResource", "/profile/password-reset",
+                            methods=['POST'])
+    api_router.add_resource("src.resources.profile:CloseProfileResource", "/profile/close", methods=['POST'])
+
+    api_router.add_resource("src.resources.users:GetUsersResource", "/users/", methods=['GET'])
+    api_router.add_resource("src.resources.users:ExportUsersResource", "/users/export", methods=['GET'])
+    api_router.add_resource("src.resources.users:BulkUsersResource", "/users/bulk", methods=['POST'])
+    api_router.add_resource("src.resources.users:GetUserResource", "/users/<id>", methods=['GET'])
+    api_router.add_resource("src.resources.users:UpdateUserResource", "/users/<id>", methods=['PUT'])
+    api_router.add_resource("src.resources.users:DeleteUserResource", "/users/<id>", methods=['DELETE'])
 
     api_router.register_routes()
 
+    # Diagnostics
+    from src.services.diagnostics import diagnostics
+    diagnostics.init_app(app)
+
+    from src.routes import diagnostics_router
+    diagnostics_router.init_app(app)
+
+    diagnostics_router.add_resource("src.resources.diagnostics:DiagnosticsStateResource", "/state", methods=['GET'])
+    diagnostics_router.add_resource("src.resources.diagnostics:StartProfileResource", "/profile", methods=['POST'])
+    diagnostics_router.add_resource("src.resources.diagnostics:GetProfileFileResource", "/profile/<name>",
+                                    methods=['GET'])
+    diagnostics_router.register_routes()
+
+    # CLI commands
+    if not lazy:
+        from src.commands.users import users_cli
+        app.cli.add_command(users_cli)
+
+        from src.commands.docs import docs_cli
+        app.cli.add_command(docs_cli)
+
+    # Connection pool warm-up; lazy apps open connections on demand
+    if not lazy:
+        pool_monitor.warm_up()
+
     return app
@@ -0,0 +1,18 @@
+"""API documentation commands for the `flask docs` CLI group"""
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from src.services.flagger import swagger
+
+docs_cli = AppGroup('docs', help="Build the API documentation.")
+
+
+@docs_cli.command('build')
+@click.option('--output-dir', type=click.Path(file_okay=False, writable=True), default=None,
+              help="Directory to write to; defaults to DOCS_DIR.")
+def build_docs(output_dir):
+    """Generate the OpenAPI document from the resource docstrings."""
+    spec = swagger.build_spec(current_app)
+    name = swagger.write_spec(spec, output_dir or current_app.config['DOCS_DIR'])
+    click.echo(f"Wrote {name} ({len(spec['paths'])} paths)")
@@ -0,0 +1,207 @@
+"""User management commands for the `flask users` CLI group"""
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.mysql import insert
+
+from src.models.users import UserModel, UserRole
+from src.schemas.users import UserSchema
+from src.services.cache import user_cache
+from src.services.db import db
+from src.services.revocation import token_generations
+from src.utils.export import EXPORT_FORMATS, iter_export
+from src.utils.hash import check_hash, compute_hash
+
+IMPORT_UPDATE_COLUMNS = ('password', 'role', 'first_name', 'last_name', 'phone_number', 'updated_at')
+
+users_cli = AppGroup('users', help="Manage users in bulk.")
+
+
+@users_cli.command('export')
+@click.option('--format', 'export_format', type=click.Choice(sorted(EXPORT_FORMATS)), default='ndjson')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), default=None,
+              help="File to write to; defaults to stdout.")
+@click.option('--batch-size', type=int, default=None, help="Rows per query; defaults to EXPORT_BATCH_SIZE.")
+@click.option('--include-inactive', is_flag=True, default=False)
+def export_users(export_format, output, batch_size, include_inactive):
+    """Stream every user as NDJSON or CSV."""
+    batch_size = batch_size or current_app.config['EXPORT_BATCH_SIZE']
+    query = UserModel.query.order_by(UserModel.id)
+    if not include_inactive:
+        query = query.filter(UserModel.active == True)
+
+    out = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in iter_export(query, UserSchema(), export_format, batch_size):
+            out.write(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+    finally:
+        if output:
+            out.close()
+
+
+def read_rows(path, import_format):
+    with open(path, newline='') as f:
+        if import_format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f)['rows']
+
+
+def write_checkpoint(path, rows):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'rows': rows}, f)
+    os.replace(tmp_path, path)
+
+
+def build_user_rows(records, hashes, verified):
+    now = datetime.utcnow()
+    rows = []
+    for record, password_hash in zip(records, hashes):
+        role = UserRole.role(record.get('role') or UserRole.USER.value)
+        if not isinstance(role, UserRole):
+            raise click.ClickException(f"Invalid role for {record['email']}: {record.get('role')}")
+        rows.append({
+            'email': record['email'],
+            'password': password_hash,
+            'role': role,
+            'first_name': record.get('first_name') or None,
+            'last_name': record.get('last_name') or None,
+            'phone_number': record.get('phone_number') or None,
+            'verified': verified,
+            'verified_at': now if verified else None,
+            'active': True,
+            'token_generation': 0,
+            'created_at': now,
+            'updated_at': now,
+        })
+    return rows
+
+
+def hash_if_changed(password, stored_hash):
+    """The stored hash when it still matches `password`, otherwise a new hash
+
+    Reusing the stored hash leaves the row's password unchanged, so the
+    upsert does not revoke the tokens of users whose password is the same.
+    """
+    if stored_hash is not None and check_hash(password, stored_hash):
+        return stored_hash
+    return compute_hash(password)
+
+
+def stored_hashes(emails):
+    """email -> password hash of the users that already exist"""
+    return dict(
+        UserModel.query.with_entities(UserModel.email, UserModel.password).filter(UserModel.email.in_(emails))
+    )
+
+
+def upsert_users(rows):
+    """One multi-row INSERT ... ON DUPLICATE KEY UPDATE for a batch of users
+
+    Rows of existing users whose password changed carry a new hash (see
+    hash_if_changed); those users have their token generation bumped,
+    revoking every token issued under the old password.
+    """
+    table = UserModel.__table__
+    statement = insert(table).values(rows)
+    # MySQL applies the assignments in order, so the generation is compared
+    # against the stored password before the password is overwritten.
+    # SQLAlchemy 1.3 renders any `inserted` column inside an expression as
+    # VALUES() of the assigned column, hence the literal VALUES(password).
+    password_changed = table.c.password != literal_column('VALUES(password)')
+    statement = statement.on_duplicate_key_update([
+        ('token_generation', func.if_(password_changed, table.c.token_generation + 1, table.c.token_generation)),
+        *((column, statement.inserted[column]) for column in IMPORT_UPDATE_COLUMNS),
+    ])
+    db.session.execute(statement)
+
+
+def evict_imported_users(emails):
+    """Drop cached copies of upserted users, which bypassed the ORM events"""
+    for id, email in UserModel.query.with_entities(UserModel.id, UserModel.email) \
+            .filter(UserModel.email.in_(emails)):
+        user_cache.evict(id, [email])
+    for email in emails:
+        token_generations.invalidate(email)
+
+
+@users_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'import_format', type=click.Choice(sorted(EXPORT_FORMATS)), default=None,
+              help="Input format; guessed from the file extension by default.")
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@click.option('--workers', type=int, default=os.cpu_count(), show_default=True,
+              help="Processes used to hash passwords.")
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+              help="Progress file used to resume; defaults to PATH.checkpoint.")
+@click.option('--restart', is_flag=True, default=False, help="Ignore any existing checkpoint.")
+@click.option('--verified', is_flag=True, default=False, help="Mark imported users as verified.")
+def import_users(path, import_format, batch_size, workers, checkpoint, restart, verified):
+    """Create or update users from a CSV or NDJSON file.
+
+    Rows are committed in batches; the number of committed rows is recorded
+    in the checkpoint file, so an interrupted import picks up after the
+    last committed batch.
+    """
+    if import_format is None:
+        import_format = 'csv' if path.endswith('.csv') else 'ndjson'
+    checkpoint = checkpoint or f"{path}.checkpoint"
+    if db.engine.dialect.name != 'mysql':
+        raise click.ClickException("Bulk import requires a MySQL database.")
+
+    done = 0 if restart else read_checkpoint(checkpoint)
+    records = itertools.islice(read_rows(path, import_format), done, None)
+    if done:
+        click.echo(f"Resuming after {done} rows", err=True)
+
+    started = time.monotonic()
+    imported = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+
+            chunksize = max(1, len(batch) // (workers * 4))
+            existing = stored_hashes([record['email'] for record in batch])
+            hashes = list(executor.map(hash_if_changed,
+                                       [record['password'] for record in batch],
+                                       [existing.get(record['email']) for record in batch],
+                                       chunksize=chunksize))
+            try:
+                upsert_users(build_user_rows(batch, hashes, verified))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            evict_imported_users([record['email'] for record in batch])
+
+            imported += len(batch)
+            done += len(batch)
+            write_checkpoint(checkpoint, done)
+
+            elapsed = time.monotonic() - started
+            click.echo(f"{done} rows committed ({imported / elapsed:.0f} rows/s)", err=True)
+
+    elapsed = time.monotonic() - started
+    click.echo(f"Imported {imported} rows in {elapsed:.1f}s ({imported / max(elapsed, 1e-9):.0f} rows/s)", err=True)
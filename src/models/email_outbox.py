@@ -0,0 +1,62 @@
+"""Email outbox models and database functionality"""
+import json
+from enum import Enum
+from src.services.db import db, commit
+from datetime import datetime
+
+
+class EmailStatus(Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class EmailOutboxModel(db.Model):
+    """Model class to represent emails waiting to be sent
+
+    Rows are written in the same transaction as the change that triggers
+    the email and delivered later by `src.tasks.email_outbox`.
+    """
+
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(256), nullable=False)
+    template = db.Column(db.String(128), nullable=False)
+    context = db.Column(db.Text, nullable=False)
+    status = db.Column(db.Enum(EmailStatus), nullable=False, default=EmailStatus.PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+        db.Index('ix_email_outbox_status_sent_at', 'status', 'sent_at'),
+    )
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.id} ({self.recipient}), status: {self.status}>"
+
+    @classmethod
+    def enqueue(cls, recipient, template, **context):
+        """Add an email to the session; it is committed with the caller's unit of work"""
+        email = cls(recipient=recipient, template=template, context=json.dumps(context))
+        db.session.add(email)
+        return email
+
+    def save(self):
+        try:
+            db.session.add(self)
+            commit()
+        except Exception as e:
+            db.session.rollback()
+            raise Exception(e)
+
+    def load_context(self):
+        return json.loads(self.context)
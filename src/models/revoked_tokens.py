@@ -1,6 +1,6 @@
 """Revoked Tokens  models and database functionality"""
 from sqlalchemy import func
-from src.services.db import db
+from src.services.db import db, commit
 from datetime import datetime
 
 
@@ -10,13 +10,23 @@ class RevokedTokenModel(db.Model):
     __tablename__ = 'revoked_tokens'
 
     id = db.Column(db.Integer, primary_key=True)
-    jti = db.Column(db.String(256))
+    jti = db.Column(db.String(256), index=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def add(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
+
+    @classmethod
+    def from_token(cls, decoded_token):
+        """Revoked token row that expires together with the token itself"""
+        exp = decoded_token.get('exp')
+        return cls(
+            jti=decoded_token['jti'],
+            expires_at=datetime.utcfromtimestamp(exp) if exp is not None else None
+        )
 
     @classmethod
     def is_jti_blacklisted(cls, jti):
@@ -1,8 +1,10 @@
 """Users  models and database functionality"""
 from enum import Enum
-from sqlalchemy import func
-from src.services.db import db
-from sqlalchemy.orm import relationship
+from sqlalchemy import func, event, inspect
+from sqlalchemy.dialects import mysql
+from src.services.db import db, commit, reading_from_replica, RoutingSession
+from src.services.cache import user_cache
+from sqlalchemy.orm import relationship, make_transient_to_detached
 from datetime import datetime
 
 
@@ -23,6 +25,10 @@ class UserRole(Enum):
             return "Invalid Role"
 
 
+# Never written to the user cache, which may be a shared Redis
+UNCACHED_COLUMNS = ('password',)
+
+
 class UserModel(db.Model):
     """Model class to represent users"""
 
@@ -38,17 +44,36 @@ class UserModel(db.Model):
     verified = db.Column(db.Boolean, nullable=False, default=False)
     verified_at = db.Column(db.DateTime, nullable=True)
     active = db.Column(db.Boolean, nullable=False, default=True)
+    token_generation = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Microsecond precision on MySQL so ETags change with every update.
+    updated_at = db.Column(db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql'),
+                           nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_users_active_id', 'active', 'id'),
+        db.Index('ix_users_verified_created_at', 'verified', 'created_at'),
+    )
 
     def __repr__(self):
         return f"<{self.__class__.__name__}: {self.id} ({self.email}), role: {self.role or '[no role]'}>"
 
+    def token_claims(self):
+        return {'token_generation': self.token_generation or 0}
+
+    def revoke_tokens(self):
+        """Invalidate every token issued to this user so far
+
+        Incremented in the UPDATE itself, so concurrent revocations are not
+        lost; the new value is loaded on the next access after the save.
+        """
+        self.token_generation = UserModel.token_generation + 1
+
     def save(self):
         try:
             db.session.add(self)
-            db.session.commit()
+            commit()
         except Exception as e:
             db.session.rollback()
             raise Exception(e)
@@ -56,15 +81,161 @@ class UserModel(db.Model):
     def delete(self):
         try:
             db.session.delete(self)
-            db.session.commit()
+            commit()
         except Exception as e:
             db.session.rollback()
             raise Exception(e)
 
     @classmethod
-    def get_first(cls, filters):
-        return cls.query.filter(*filters).first()
+    def get_first(cls, filters, for_update=False):
+        """First matching row; `for_update` locks it until the commit
+
+        Lock the row when its version is checked against If-Match before
+        writing, so no other update lands between the check and the save.
+        """
+        query = cls.query.filter(*filters)
+        if for_update:
+            query = query.with_for_update()
+        return query.first()
+
+    @classmethod
+    def get_by_id(cls, id, for_update=False):
+        """get_first by id, for ids taken from the URL"""
+        try:
+            id = int(id)
+        except (TypeError, ValueError):
+            return None
+        return cls.get_first([cls.id == id], for_update=for_update)
+
+    @classmethod
+    def get_cached_by_id(cls, id):
+        """get_first by id, served from the user cache when possible
+
+        Cached rows lack the password and may be a little stale; handlers
+        that change a user load it with get_first or get_by_id instead.
+        """
+        try:
+            id = int(id)
+        except (TypeError, ValueError):
+            return None
+        data = user_cache.get_by_id(id)
+        if data is not None:
+            return cls._from_cache(data)
+        return cls._load_and_cache([cls.id == id])
+
+    @classmethod
+    def get_cached_by_email(cls, email):
+        """get_first by email, served from the user cache when possible"""
+        data = user_cache.get_by_email(email)
+        if data is not None:
+            return cls._from_cache(data)
+        return cls._load_and_cache([cls.email == email])
+
+    @classmethod
+    def get_version(cls, id=None, email=None):
+        """(id, updated_at, active) of a user without loading the full row"""
+        if email is not None:
+            data = user_cache.get_by_email(email)
+            filters = [cls.email == email]
+        else:
+            try:
+                id = int(id)
+            except (TypeError, ValueError):
+                return None
+            data = user_cache.get_by_id(id)
+            filters = [cls.id == id]
+        if data is not None:
+            data = cls._from_cache_data(data)
+            return data['id'], data['updated_at'], data['active']
+        return cls.query.with_entities(cls.id, cls.updated_at, cls.active).filter(*filters).first()
+
+    @classmethod
+    def get_page_versions(cls, filters, after=None, limit=50):
+        """(id, updated_at) pairs of a keyset page; see get_page"""
+        query = cls.query.with_entities(cls.id, cls.updated_at).filter(*filters)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        rows = query.order_by(cls.id).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+
+    @classmethod
+    def _load_and_cache(cls, filters):
+        user = cls.get_first(filters)
+        # A lagging replica could hand back a row older than the last
+        # eviction, so only rows read from the primary are cached.
+        if user is not None and not reading_from_replica():
+            user_cache.store(user.to_cache())
+        return user
+
+    @classmethod
+    def _from_cache(cls, data):
+        # Rebuild the row as if it had just been loaded, then attach it to
+        # the session without a SELECT so it can still be modified and saved.
+        user = cls(**cls._from_cache_data(data))
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def to_cache(self):
+        """JSON-safe column values, leaving out the password hash"""
+        data = {}
+        for column in inspect(self).mapper.column_attrs:
+            if column.key in UNCACHED_COLUMNS:
+                continue
+            value = getattr(self, column.key)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, Enum):
+                value = value.value
+            data[column.key] = value
+        return data
+
+    @classmethod
+    def _from_cache_data(cls, data):
+        columns = {}
+        for column in inspect(cls).column_attrs:
+            if column.key not in data:
+                continue
+            value = data[column.key]
+            # Variants such as updated_at keep the generic type in `impl`.
+            column_type = column.columns[0].type
+            python_type = getattr(column_type, 'impl', column_type).python_type
+            if value is not None and issubclass(python_type, (datetime, Enum)):
+                value = datetime.fromisoformat(value) if python_type is datetime else python_type(value)
+            columns[column.key] = value
+        return columns
 
     @classmethod
     def get_all(cls, filters):
         return cls.query.filter(*filters).all()
+
+    @classmethod
+    def get_page(cls, filters, after=None, limit=50):
+        """Keyset page ordered by id; returns the rows and whether more follow"""
+        query = cls.query.filter(*filters)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        rows = query.order_by(cls.id).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def collect_changed_users(session, flush_context):
+    """Note the users a flush changed, with every email they were cached under"""
+    for target in list(session.dirty) + list(session.deleted):
+        if isinstance(target, UserModel):
+            history = inspect(target).attrs.email.history
+            emails = session.info.setdefault('changed_users', {}).setdefault(target.id, set())
+            emails.update({target.email, *history.deleted})
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def evict_changed_users(session):
+    # Evicting only once the change is committed keeps a concurrent read of
+    # the old row from caching it again after the eviction.
+    for id, emails in session.info.pop('changed_users', {}).items():
+        user_cache.evict(id, emails)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_users', None)
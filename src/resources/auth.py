@@ -1,22 +1,28 @@
 from datetime import datetime
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, jwt_refresh_token_required, \
     get_jwt_identity, get_raw_jwt
 from flask import current_app as app
 
 from src.models.revoked_tokens import RevokedTokenModel
 from src.models.users import UserModel, UserRole
+from src.schemas.auth import sign_up_schema, sign_in_schema
+from src.services.db import unit_of_work
+from src.services.revocation import revocation_index, token_generations
 
-from src.utils.hash import generate_hash, verify_hash
+from src.services.hasher import HashPoolSaturated
+from src.utils.hash import generate_hash, verify_and_rehash
 
 from src.utils.api_response import APIResponse
+from src.utils.request_schema import use_schema
 
 from src.utils.auth_token import generate_confirmation_token, confirm_token
-from src.utils.email import send_registration_email
+from src.utils.email import queue_registration_email
 
 
 class SignUpResource(Resource):
-    def post(self):
+    @use_schema(sign_up_schema)
+    def post(self, data):
         """
         Sign Up
         ---
@@ -66,15 +72,6 @@ class SignUpResource(Resource):
             500:
               description: Internal server error
         """
-        parser = reqparse.RequestParser()
-        parser.add_argument('email', required=True, help='Email required!')
-        parser.add_argument('password', required=True, help='Password required!')
-        roles = ("Admin", "User", "Developer")
-        parser.add_argument('role', choices=roles, required=True, help='Invalid role!')
-        parser.add_argument('first_name',  required=True, help='First name required!')
-        parser.add_argument('last_name',  required=True, help='Last name required!')
-        data = parser.parse_args()
-
         try:
             user = UserModel.get_first([
                 UserModel.email == data['email']
@@ -83,6 +80,9 @@ class SignUpResource(Resource):
             if user is not None:
                 if user.verified:
                     return APIResponse.error_409("User already exist!")
+                # Unverified users are pruned by created_at; restart the
+                # clock so the new verification link outlives the account.
+                user.created_at = datetime.utcnow()
             else:
                 user = UserModel(email=data['email'])
 
@@ -101,18 +101,22 @@ class SignUpResource(Resource):
                 'host_name': app.config['HOST_NAME']
             }
 
-            send_registration_email(payload, token)
-            user.save()
+            with unit_of_work():
+                user.save()
+                queue_registration_email(payload, token)
 
             response = {'message': 'Email sent!'}
             return APIResponse.success_200(response)
+        except HashPoolSaturated:
+            return APIResponse.error_503("Server busy, please retry.")
         except Exception as e:
             print(e)
             return APIResponse.error_500()
 
 
 class SignInResource(Resource):
-    def post(self):
+    @use_schema(sign_in_schema)
+    def post(self, data):
         """
         Sign In
         ---
@@ -150,11 +154,6 @@ class SignInResource(Resource):
           500:
             description: Internal server error
         """
-        parser = reqparse.RequestParser()
-        parser.add_argument('email', required=True, help='Email required!')
-        parser.add_argument('password', required=True, help='Password required!')
-        data = parser.parse_args()
-
         try:
             email = data['email']
 
@@ -165,10 +164,15 @@ class SignInResource(Resource):
                 return APIResponse.error_404("User not found!")
 
             if user.verified:
-                if verify_hash(data['password'], user.password):
+                verified, new_hash = verify_and_rehash(data['password'], user.password)
+                if verified:
+                    if new_hash is not None:
+                        user.password = new_hash
+                        user.save()
+                    claims = user.token_claims()
                     response = {
-                        'access_token': create_access_token(identity=email),
-                        'refresh_token': create_refresh_token(identity=email)
+                        'access_token': create_access_token(identity=email, user_claims=claims),
+                        'refresh_token': create_refresh_token(identity=email, user_claims=claims)
                     }
                     return APIResponse.success_200(response)
                 else:
@@ -176,6 +180,8 @@ class SignInResource(Resource):
             else:
                 return APIResponse.error_403("User not verified!")
 
+        except HashPoolSaturated:
+            return APIResponse.error_503("Server busy, please retry.")
         except Exception as e:
             print(e)
             return APIResponse.error_500()
@@ -203,10 +209,11 @@ class SignOutResource(Resource):
           500:
             description: Internal server error
         """
-        jti = get_raw_jwt()['jti']
+        raw_jwt = get_raw_jwt()
         try:
-            revoked_token = RevokedTokenModel(jti=jti)
+            revoked_token = RevokedTokenModel.from_token(raw_jwt)
             revoked_token.add()
+            revocation_index.add(revoked_token.jti, revoked_token.expires_at)
             response = {'message': 'Token revoked'}
             return APIResponse.success_204(response)
         except Exception as e:
@@ -236,9 +243,10 @@ class TokenRefreshResource(Resource):
         """
         try:
             email = get_jwt_identity()
+            claims = {'token_generation': token_generations.get(email)}
             response = {
-                'access_token': create_access_token(identity=email),
-                'refresh_token': create_refresh_token(identity=email)
+                'access_token': create_access_token(identity=email, user_claims=claims),
+                'refresh_token': create_refresh_token(identity=email, user_claims=claims)
             }
             return APIResponse.success_200(response)
         except Exception as e:
@@ -324,10 +332,16 @@ class ResendVerifyEmailResource(Resource):
             payload = {
                 'email': user.email,
                 'first_name': user.first_name,
-                'last_name': user.last_name
+                'last_name': user.last_name,
+                'service_name': app.config['SERVICE_NAME'],
+                'host_name': app.config['HOST_NAME']
             }
             token = generate_confirmation_token(email)
-            send_registration_email(payload, token)
+            # Keep the account from being pruned before the new link expires.
+            user.created_at = datetime.utcnow()
+            with unit_of_work():
+                user.save()
+                queue_registration_email(payload, token)
 
             response = {"message": "Email sent again."}
             return APIResponse.success_200(response)
@@ -389,9 +403,10 @@ class UpdateEmailResource(Resource):
                 'service_name': app.config['SERVICE_NAME'],
                 'host_name': app.config['HOST_NAME']
             }
-            send_registration_email(payload, token)
+            with unit_of_work():
+                user.save()
+                queue_registration_email(payload, token)
 
-            user.save()
             response = {'message': 'Email updated'}
             return APIResponse.success_200(response)
         except Exception as e:
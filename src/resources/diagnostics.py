@@ -0,0 +1,54 @@
+from flask import request, send_file
+from flask import current_app as app
+from flask_restful import Resource
+from flask_jwt_extended import jwt_required
+
+from src.services.diagnostics import diagnostics
+from src.utils.api_response import APIResponse
+from src.utils.permissions import admin_required
+
+
+class DiagnosticsStateResource(Resource):
+    @jwt_required
+    @admin_required
+    def get(self):
+        try:
+            return APIResponse.success_200(diagnostics.state())
+        except Exception as e:
+            print(e)
+            return APIResponse.error_500()
+
+
+class StartProfileResource(Resource):
+    @jwt_required
+    @admin_required
+    def post(self):
+        try:
+            seconds = float(request.args.get('seconds', 10))
+            interval_ms = float(request.args.get('interval_ms', app.config['DIAGNOSTICS_SAMPLE_INTERVAL_MS']))
+        except ValueError:
+            return APIResponse.error_400("Invalid seconds or interval_ms!")
+        if not 0 < seconds <= app.config['DIAGNOSTICS_MAX_SECONDS']:
+            return APIResponse.error_400(f"seconds must be within 0-{app.config['DIAGNOSTICS_MAX_SECONDS']}!")
+        # At least one sample per profile; also rejects nan and inf
+        if not 1 <= interval_ms <= seconds * 1000:
+            return APIResponse.error_400(f"interval_ms must be within 1-{seconds * 1000:g}!")
+
+        try:
+            name = diagnostics.start_profile(seconds, interval_ms)
+            if name is None:
+                return APIResponse.error_409("A profile is already running in this worker!")
+            return APIResponse.success_201({'name': name, 'seconds': seconds})
+        except Exception as e:
+            print(e)
+            return APIResponse.error_500()
+
+
+class GetProfileFileResource(Resource):
+    @jwt_required
+    @admin_required
+    def get(self, name):
+        path = diagnostics.profile_path(name)
+        if path is None:
+            return APIResponse.error_404("Profile not ready or not found!")
+        return send_file(path, mimetype='text/plain', as_attachment=True, attachment_filename=name)
@@ -1,17 +1,22 @@
-import json
-from flask import make_response, jsonify
-from flask_restful import Resource, reqparse
+from flask import make_response, jsonify, request
+from flask_restful import Resource
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
-from src.models.users import UserModel, UserRole
+from src.models.users import UserModel
 from src.schemas.users import UserSchema
+from src.schemas.profile import profile_update_schema, password_reset_schema
+from src.services.db import replica_reads
+from src.services.revocation import token_generations
 
 from src.utils.api_response import APIResponse
+from src.utils.request_schema import use_schema
+from src.services.hasher import HashPoolSaturated
 from src.utils.hash import generate_hash, verify_hash
 
 
 class GetProfileResource(Resource):
     @jwt_required
+    @replica_reads
     def get(self):
         """
         Get profile
@@ -32,16 +37,19 @@ class GetProfileResource(Resource):
         """
         try:
             email = get_jwt_identity()
-            user = UserModel.get_first([
-                UserModel.email == email
-            ])
+            if request.if_none_match:
+                version = UserModel.get_version(email=email)
+                if version is not None:
+                    etag = APIResponse.entity_etag(version[0], version[1])
+                    if APIResponse.is_not_modified(etag):
+                        return APIResponse.not_modified_304(etag)
+
+            user = UserModel.get_cached_by_email(email)
             if user is None:
                 return APIResponse.error_404("User not found!")
 
-            result = UserSchema().dumps(user)
-
-            response = json.loads(result)
-            return APIResponse.success_200(response)
+            etag = APIResponse.entity_etag(user.id, user.updated_at)
+            return APIResponse.success_200(user, UserSchema, etag=etag)
         except Exception as e:
             print(e)
             return APIResponse.error_500()
@@ -49,7 +57,8 @@ class GetProfileResource(Resource):
 
 class UpdateProfileResource(Resource):
     @jwt_required
-    def put(self):
+    @use_schema(profile_update_schema)
+    def put(self, data):
         """
         Update profile
         ---
@@ -67,12 +76,6 @@ class UpdateProfileResource(Resource):
                 properties:
                   email:
                     type: string
-                  role:
-                    type: string
-                    enum:
-                      - User
-                      - Developer
-                      - Admin
                   first_name:
                     type: string
                   last_name:
@@ -81,14 +84,12 @@ class UpdateProfileResource(Resource):
                     type: string
                 required:
                   - email
-                  - role
                 example:
                   email: user@mail.com
-                  role: User
                   first_name: Test
                   last_name: User
                   phone_number: (234)567-8901
-          description: email and role must be specified.
+          description: email must be specified; the role can only be changed by an Admin.
           required: true
         responses:
             200:
@@ -98,32 +99,22 @@ class UpdateProfileResource(Resource):
             500:
               description: Internal server error
         """
-        parser = reqparse.RequestParser()
-        parser.add_argument('email', required=True, help='Email required!')
-        roles = ("Admin", "User", "Developer")
-        parser.add_argument('role', choices=roles, required=True, help='Invalid role!')
-        parser.add_argument('first_name')
-        parser.add_argument('last_name')
-        parser.add_argument('phone_number')
-        data = parser.parse_args()
-
         try:
             email = get_jwt_identity()
-            user = UserModel.get_first([
-                UserModel.email == email
-            ])
+            user = UserModel.get_first([UserModel.email == email], for_update=True)
             if user is None:
                 return APIResponse.error_404("User not found!")
 
+            if APIResponse.is_precondition_failed(APIResponse.entity_etag(user.id, user.updated_at)):
+                return APIResponse.error_412("Profile has been modified!")
+
             user.first_name = data['first_name']
             user.last_name = data['last_name']
-            user.role = UserRole.role(data['role'])
             user.phone_number = data['phone_number']
 
             user.save()
-            result = UserSchema().dumps(user)
-            response = json.loads(result)
-            return APIResponse.success_200(response)
+            etag = APIResponse.entity_etag(user.id, user.updated_at)
+            return APIResponse.success_200(user, UserSchema, etag=etag)
 
         except Exception as e:
             print(e)
@@ -132,7 +123,8 @@ class UpdateProfileResource(Resource):
 
 class PasswordResetResource(Resource):
     @jwt_required
-    def post(self):
+    @use_schema(password_reset_schema)
+    def post(self, data):
         """
         Password Reset
         ---
@@ -178,18 +170,9 @@ class PasswordResetResource(Resource):
             500:
               description: Internal server error
         """
-        parser = reqparse.RequestParser()
-        parser.add_argument('email', required=True, help='Email required!')
-        parser.add_argument('current_password', required=True, help='Current password required!')
-        parser.add_argument('new_password', required=True, help='New password required!')
-        parser.add_argument('confirm_password', required=True, help='Confirm password confirm required!')
-        data = parser.parse_args()
-
         try:
             email = get_jwt_identity()
-            user = UserModel.get_first([
-                UserModel.email == email
-            ])
+            user = UserModel.get_first([UserModel.email == email])
             if user is None:
                 return APIResponse.error_404("User not found!")
 
@@ -200,10 +183,14 @@ class PasswordResetResource(Resource):
                 return APIResponse.error_400("Confirm password not match!")
 
             user.password = generate_hash(data['new_password'])
+            user.revoke_tokens()
             user.save()
+            token_generations.set(email, user.token_generation)
             response = {'message': "Password reset success!"}
             return APIResponse.success_200(response)
 
+        except HashPoolSaturated:
+            return APIResponse.error_503("Server busy, please retry.")
         except Exception as e:
             print(e)
             return APIResponse.error_500()
@@ -245,14 +232,14 @@ class CloseProfileResource(Resource):
         """
         try:
             email = get_jwt_identity()
-            user = UserModel.get_first([
-                UserModel.email == email
-            ])
+            user = UserModel.get_first([UserModel.email == email])
             if user is None:
                 return APIResponse.error_404("User not found")
 
             user.active = False
+            user.revoke_tokens()
             user.save()
+            token_generations.set(email, user.token_generation)
 
             response = {'message': "User deactivated!"}
             return APIResponse.success_204(response)
@@ -1,26 +1,61 @@
-import json
-from flask import make_response, jsonify
-from flask_restful import Resource, reqparse
+from flask import make_response, jsonify, request, Response, stream_with_context
+from flask import current_app as app
+from flask_restful import Resource
 from flask_jwt_extended import jwt_required, jwt_refresh_token_required, get_jwt_identity
 
 from src.models.users import UserModel, UserRole
-from src.schemas.users import UserSchema
+from src.schemas.users import UserSchema, user_update_schema, bulk_users_schema
+from src.services.db import replica_reads
+from src.services.revocation import token_generations
 
 from src.utils.api_response import APIResponse
+from src.utils.request_schema import use_schema
+from src.utils.permissions import admin_required
+from src.utils.bulk_users import run_bulk_operations
+from src.services.hasher import HashPoolSaturated
 from src.utils.hash import generate_hash
+from src.utils.export import EXPORT_FORMATS, iter_export
+from src.utils.pagination import encode_cursor, decode_cursor, parse_limit, cached_count
 
 
 class GetUsersResource(Resource):
     @jwt_required
+    @replica_reads
     def get(self):
         try:
-            users = UserModel.get_all([
-                UserModel.active == True
-            ])
-            result = UserSchema().dumps(users, many=True)
+            after = decode_cursor(request.args.get('after'))
+            limit = parse_limit(
+                request.args.get('limit'),
+                app.config['PAGINATION_DEFAULT_LIMIT'],
+                app.config['PAGINATION_MAX_LIMIT']
+            )
+        except ValueError as e:
+            return APIResponse.error_400(str(e))
 
-            response = json.loads(result)
-            return APIResponse.success_200(response)
+        try:
+            filters = [UserModel.active == True]
+            count = None
+            if request.args.get('count') in ('1', 'true'):
+                count = cached_count(
+                    'users.active',
+                    UserModel.query.filter(*filters),
+                    app.config['PAGINATION_COUNT_CACHE_TTL']
+                )
+
+            # has_more and the count are part of the body, so of the ETag too
+            if request.if_none_match:
+                versions, has_more = UserModel.get_page_versions(filters, after=after, limit=limit)
+                etag = APIResponse.collection_etag(versions, after, limit, has_more, count)
+                if APIResponse.is_not_modified(etag):
+                    return APIResponse.not_modified_304(etag)
+
+            users, has_more = UserModel.get_page(filters, after=after, limit=limit)
+            next_cursor = encode_cursor(users[-1].id) if has_more else None
+            etag = APIResponse.collection_etag(
+                [(user.id, user.updated_at) for user in users], after, limit, has_more, count
+            )
+
+            return APIResponse.paginated_200(users, next_cursor, count, schema=UserSchema, etag=etag)
         except Exception as e:
             print(e)
             return APIResponse.error_500()
@@ -30,21 +65,60 @@ class GetUsersResource(Resource):
         return APIResponse.error_403()
 
 
+class ExportUsersResource(Resource):
+    @jwt_required
+    @admin_required
+    @replica_reads
+    def get(self):
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return APIResponse.error_400("Invalid format!")
+
+        query = UserModel.query.filter(UserModel.active == True).order_by(UserModel.id)
+        rows = iter_export(query, UserSchema(), export_format, app.config['EXPORT_BATCH_SIZE'])
+        response = Response(stream_with_context(rows), mimetype=EXPORT_FORMATS[export_format])
+        response.headers['Content-Disposition'] = f'attachment; filename=users.{export_format}'
+        return response
+
+
+class BulkUsersResource(Resource):
+    @jwt_required
+    @admin_required
+    @use_schema(bulk_users_schema)
+    def post(self, data):
+        operations = data['operations']
+        if len(operations) > app.config['USER_BULK_MAX_OPERATIONS']:
+            return APIResponse.error_400(
+                f"At most {app.config['USER_BULK_MAX_OPERATIONS']} operations per request!"
+            )
+
+        try:
+            return APIResponse.success_200(run_bulk_operations(operations))
+        except HashPoolSaturated:
+            return APIResponse.error_503("Server busy, please retry.")
+        except Exception as e:
+            print(e)
+            return APIResponse.error_500()
+
+
 class GetUserResource(Resource):
     @jwt_required
+    @replica_reads
     def get(self, id):
         try:
-            user = UserModel.get_first([
-                UserModel.id == id,
-                UserModel.active == True
-            ])
-            if user is None:
+            if request.if_none_match:
+                version = UserModel.get_version(id=id)
+                if version is not None and version[2]:
+                    etag = APIResponse.entity_etag(version[0], version[1])
+                    if APIResponse.is_not_modified(etag):
+                        return APIResponse.not_modified_304(etag)
+
+            user = UserModel.get_cached_by_id(id)
+            if user is None or not user.active:
                 return APIResponse.error_404()
 
-            result = UserSchema().dumps(user)
-
-            response = json.loads(result)
-            return APIResponse.success_200(response)
+            etag = APIResponse.entity_etag(user.id, user.updated_at)
+            return APIResponse.success_200(user, UserSchema, etag=etag)
         except Exception as e:
             print(e)
             return APIResponse.error_500()
@@ -52,35 +126,32 @@ class GetUserResource(Resource):
 
 class UpdateUserResource(Resource):
     @jwt_required
-    def put(self, id):
-        parser = reqparse.RequestParser()
-        parser.add_argument('email', required=True, help='Email required!')
-        parser.add_argument('password', required=True, help='Password required!')
-        roles = ("Admin", "User", "Developer")
-        parser.add_argument('role', choices=roles, required=True, help='Invalid role!')
-        parser.add_argument('first_name')
-        parser.add_argument('last_name')
-        data = parser.parse_args()
-
+    @admin_required
+    @use_schema(user_update_schema)
+    def put(self, id, data):
         try:
-            user = UserModel.get_first([
-                UserModel.id == id,
-                UserModel.active == True
-            ])
-            if user is None:
+            user = UserModel.get_by_id(id, for_update=True)
+            if user is None or not user.active:
                 return APIResponse.error_404()
 
+            if APIResponse.is_precondition_failed(APIResponse.entity_etag(user.id, user.updated_at)):
+                return APIResponse.error_412("User has been modified!")
+
+            old_email = user.email
             user.email = data['email']
             user.password = generate_hash(data['password'])
             user.role = UserRole.role(data['role'])
             user.first_name = data['first_name']
             user.last_name = data['last_name']
+            user.revoke_tokens()
             user.save()
+            token_generations.invalidate(old_email)
+            token_generations.set(user.email, user.token_generation)
 
-            result = UserSchema().dumps(user)
-
-            response = json.loads(result)
-            return APIResponse.success_200(response)
+            etag = APIResponse.entity_etag(user.id, user.updated_at)
+            return APIResponse.success_200(user, UserSchema, etag=etag)
+        except HashPoolSaturated:
+            return APIResponse.error_503("Server busy, please retry.")
         except Exception as e:
             print(e)
             return APIResponse.error_500()
@@ -88,16 +159,15 @@ class UpdateUserResource(Resource):
 
 class DeleteUserResource(Resource):
     @jwt_required
+    @admin_required
     def delete(self, id):
         try:
-            user = UserModel.get_first([
-                UserModel.id == id,
-                UserModel.active == True
-            ])
-            if user is None:
+            user = UserModel.get_by_id(id)
+            if user is None or not user.active:
                 return APIResponse.error_404()
 
             user.delete()
+            token_generations.invalidate(user.email)
             response = {'message': 'Entity deleted'}
             return APIResponse.success_204(response)
 
@@ -3,21 +3,72 @@
 Imports any Flask resources and registers them as API routes to accept
 requests and return responses on the Flask server.
 """
+import threading
+from importlib import import_module
+
 from flask import Blueprint, current_app, jsonify
 from flask_restful import Api, Resource
 
 
+def lazy_resource(import_name):
+    """Resource standing in for `module:ClassName` until its first request
+
+    The module is imported when a request first reaches the route, so apps
+    built with LAZY_STARTUP only pay for the resources they serve.
+    """
+    module_name, _, class_name = import_name.partition(':')
+    lock = threading.Lock()
+    loaded = []
+
+    def load():
+        if not loaded:
+            with lock:
+                if not loaded:
+                    loaded.append(getattr(import_module(module_name), class_name))
+        return loaded[0]
+
+    class LazyResource(Resource):
+        def dispatch_request(self, *args, **kwargs):
+            resource = load()()
+            resource.endpoint = self.endpoint
+            resource.mediatypes = self.mediatypes
+            return resource.dispatch_request(*args, **kwargs)
+
+    LazyResource.__name__ = LazyResource.__qualname__ = class_name
+    LazyResource.__module__ = module_name
+    return LazyResource
+
+
 class ApiRouter:
-    def __init__(self, url_prefix, app=None):
+    def __init__(self, url_prefix, app=None, name=None):
         self.app = app
         self.url_prefix = url_prefix
-        self.api_blueprint = Blueprint(self.__class__.__name__, __name__)
+        self.api_blueprint = Blueprint(name or self.__class__.__name__, __name__)
         self.api = Api(self.api_blueprint, catch_all_404s=True)
 
     def init_app(self, app):
         self.app = app
+        app.config.setdefault('LAZY_STARTUP', False)
+
+    def add_decorator(self, decorator):
+        """Wrap every resource added from now on with `decorator`"""
+        self.api.decorators.append(decorator)
 
     def add_resource(self, resource, path, methods=None, strict_slashes=False):
+        """Add a resource class, or one named by a "module:ClassName" string
+
+        Named resources are imported now, or on their first request when
+        the app is built with LAZY_STARTUP; those need explicit `methods`.
+        """
+        if isinstance(resource, str):
+            if self.app.config['LAZY_STARTUP']:
+                if methods is None:
+                    raise ValueError(f"Lazy resource {resource} needs explicit methods")
+                resource = lazy_resource(resource)
+            else:
+                module_name, _, class_name = resource.partition(':')
+                resource = getattr(import_module(module_name), class_name)
+
         if methods is None:
             self.api.add_resource(resource, path, strict_slashes=strict_slashes)
         else:
@@ -28,3 +79,6 @@ class ApiRouter:
 
 
 api_router = ApiRouter(url_prefix="/api")
+
+# Admin-only worker diagnostics, kept apart from the API's metrics and tracing
+diagnostics_router = ApiRouter(url_prefix="/api/diagnostics", name="diagnostics")
@@ -0,0 +1,34 @@
+from marshmallow import fields, validate, EXCLUDE
+
+from src.services.marshmallow import ma
+from src.models.users import UserRole
+
+ROLES = tuple(role.value for role in UserRole)
+
+
+def required(message):
+    return {'required': message, 'null': message}
+
+
+class SignUpSchema(ma.Schema):
+    email = fields.String(required=True, error_messages=required('Email required!'))
+    password = fields.String(required=True, error_messages=required('Password required!'))
+    role = fields.String(required=True, validate=validate.OneOf(ROLES, error='Invalid role!'),
+                         error_messages=required('Invalid role!'))
+    first_name = fields.String(required=True, error_messages=required('First name required!'))
+    last_name = fields.String(required=True, error_messages=required('Last name required!'))
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+class SignInSchema(ma.Schema):
+    email = fields.String(required=True, error_messages=required('Email required!'))
+    password = fields.String(required=True, error_messages=required('Password required!'))
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+sign_up_schema = SignUpSchema()
+sign_in_schema = SignInSchema()
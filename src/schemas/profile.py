@@ -0,0 +1,28 @@
+from marshmallow import fields, EXCLUDE
+
+from src.services.marshmallow import ma
+from src.schemas.auth import required
+
+
+class ProfileUpdateSchema(ma.Schema):
+    email = fields.String(required=True, error_messages=required('Email required!'))
+    first_name = fields.String(missing=None, allow_none=True)
+    last_name = fields.String(missing=None, allow_none=True)
+    phone_number = fields.String(missing=None, allow_none=True)
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+class PasswordResetSchema(ma.Schema):
+    email = fields.String(required=True, error_messages=required('Email required!'))
+    current_password = fields.String(required=True, error_messages=required('Current password required!'))
+    new_password = fields.String(required=True, error_messages=required('New password required!'))
+    confirm_password = fields.String(required=True, error_messages=required('Confirm password confirm required!'))
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+profile_update_schema = ProfileUpdateSchema()
+password_reset_schema = PasswordResetSchema()
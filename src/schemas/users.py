@@ -1,8 +1,11 @@
-from marshmallow import fields, Schema, validate
+from marshmallow import fields, Schema, validate, validates_schema, ValidationError, EXCLUDE
 from marshmallow_enum import EnumField
 
 from src.services.marshmallow import ma
 from src.models.users import UserRole
+from src.schemas.auth import ROLES, required
+
+BULK_OPERATIONS = ('create', 'update', 'deactivate', 'delete')
 
 
 class UserSchema(ma.Schema):
@@ -18,3 +21,55 @@ class UserSchema(ma.Schema):
             'phone_number',
             'verified'
         )
+
+
+class UserUpdateSchema(ma.Schema):
+    email = fields.String(required=True, error_messages=required('Email required!'))
+    password = fields.String(required=True, error_messages=required('Password required!'))
+    role = fields.String(required=True, validate=validate.OneOf(ROLES, error='Invalid role!'),
+                         error_messages=required('Invalid role!'))
+    first_name = fields.String(missing=None, allow_none=True)
+    last_name = fields.String(missing=None, allow_none=True)
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+user_update_schema = UserUpdateSchema()
+
+
+class BulkUserOperationSchema(ma.Schema):
+    op = fields.String(required=True, validate=validate.OneOf(BULK_OPERATIONS, error='Invalid operation!'),
+                       error_messages=required('Operation required!'))
+    id = fields.Integer()
+    email = fields.String()
+    password = fields.String()
+    role = fields.String(validate=validate.OneOf(ROLES, error='Invalid role!'))
+    first_name = fields.String(allow_none=True)
+    last_name = fields.String(allow_none=True)
+    phone_number = fields.String(allow_none=True)
+    verified = fields.Boolean()
+
+    class Meta:
+        unknown = EXCLUDE
+
+    @validates_schema
+    def validate_operation(self, data, **kwargs):
+        if data['op'] == 'create':
+            for field in ('email', 'password'):
+                if field not in data:
+                    raise ValidationError(f"{field} required for create!", field)
+        elif 'id' not in data:
+            raise ValidationError(f"id required for {data['op']}!", 'id')
+
+
+class BulkUsersSchema(ma.Schema):
+    operations = fields.List(fields.Dict(), required=True, validate=validate.Length(min=1),
+                             error_messages=required('Operations required!'))
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+bulk_user_operation_schema = BulkUserOperationSchema()
+bulk_users_schema = BulkUsersSchema()
@@ -0,0 +1,187 @@
+"""Read-through caches for hot entities
+
+Lookups go to a per-process LRU with a TTL first, then to an optional
+shared backend, and only then to the database. The shared backend is
+configured with `USER_CACHE_BACKEND`: unset disables it, `memory` uses an
+in-process stand-in (handy for tests and single-process runs), and a
+`redis://` URL shares entries between every worker and host.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize=10000, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class InMemoryBackend:
+    """Stand-in for a shared cache backend, local to the process"""
+
+    def __init__(self):
+        self._cache = LRUCache(maxsize=100000)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, ttl):
+        self._cache.ttl = ttl
+        self._cache.set(key, value)
+
+    def delete(self, *keys):
+        for key in keys:
+            self._cache.delete(key)
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, json.dumps(value), ex=int(ttl))
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*keys)
+
+
+def create_backend(url):
+    if not url:
+        return None
+    if url == 'memory':
+        return InMemoryBackend()
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported cache backend: {url}")
+
+
+class TwoLevelCache:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.local = LRUCache()
+        self.shared = None
+        self.ttl = 30
+        self._counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_SIZE', 10000)
+        app.config.setdefault('USER_CACHE_TTL', 30)
+        app.config.setdefault('USER_CACHE_SHARED_TTL', 300)
+        app.config.setdefault('USER_CACHE_BACKEND', None)
+        self.ttl = app.config['USER_CACHE_SHARED_TTL']
+        self.local = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+        self.shared = create_backend(app.config['USER_CACHE_BACKEND'])
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key):
+        key = self._key(key)
+        value = self.local.get(key)
+        if value is not None:
+            self._counters['local_hits'] += 1
+            return value
+
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self._counters['shared_hits'] += 1
+                self.local.set(key, value)
+                return value
+
+        self._counters['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        key = self._key(key)
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl)
+
+    def delete(self, *keys):
+        keys = [self._key(key) for key in keys]
+        for key in keys:
+            self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(*keys)
+
+    def stats(self):
+        lookups = sum(self._counters.values())
+        hits = self._counters['local_hits'] + self._counters['shared_hits']
+        return dict(self._counters, size=len(self.local), hit_rate=hits / lookups if lookups else 0.0)
+
+
+class UserCache(TwoLevelCache):
+    """Users keyed by id, plus an email -> id index
+
+    Values are JSON-safe column dicts without the password (see
+    `UserModel.to_cache`) rather than ORM instances, so they can live in a
+    shared backend and be reattached to any session.
+    """
+
+    def __init__(self):
+        super().__init__('user')
+
+    def get_by_id(self, id):
+        return self.get(f"id:{id}")
+
+    def get_by_email(self, email):
+        id = self.get(f"email:{email}")
+        if id is None:
+            return None
+        data = self.get_by_id(id)
+        if data is None or data['email'] != email:
+            return None
+        return data
+
+    def store(self, data):
+        self.set(f"id:{data['id']}", data)
+        self.set(f"email:{data['email']}", data['id'])
+
+    def evict(self, id=None, emails=()):
+        keys = [f"email:{email}" for email in emails if email]
+        if id is not None:
+            keys.append(f"id:{id}")
+        self.delete(*keys)
+
+
+user_cache = UserCache()
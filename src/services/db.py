@@ -1,6 +1,399 @@
 """Base classes and utilities for models to inherit or use"""
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import MetaData
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import MetaData, event, exc, orm, text
+from sqlalchemy.pool import Pool, QueuePool
+from sqlalchemy.sql.expression import UpdateBase
+
+from src.services.cache import LRUCache, TwoLevelCache, create_backend
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMonitor:
+    """Connection pool warm-up, fork safety and checkout metrics
+
+    Connections remember the pid that opened them and are discarded when
+    checked out in another process, so a pool created before uWSGI forks
+    is never shared between workers. With `DB_POOL_WARMUP` set, each worker
+    opens that many connections up front instead of paying for them on its
+    first requests.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self._warm_pid = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('DB_POOL_WARMUP', 0)
+        self._warm_pid = None
+        if not app.config.get('LAZY_STARTUP'):
+            app.before_request(self._ensure_warm)
+
+    def _ensure_warm(self):
+        if self._warm_pid != os.getpid():
+            self.warm_up()
+
+    def warm_up(self):
+        """Open up to DB_POOL_WARMUP connections in this process and return them to the pool"""
+        self._warm_pid = os.getpid()
+        self._stats = {}
+        count = self.app.config['DB_POOL_WARMUP']
+        if not count:
+            return
+        for engine in self.engines():
+            connections = []
+            try:
+                for _ in range(min(count, self._capacity(engine.pool) or count)):
+                    connections.append(engine.connect())
+            except Exception as e:
+                logger.warning("Pool warm-up for %s stopped: %s", engine.url, e)
+            finally:
+                for connection in connections:
+                    connection.close()
+
+    def engines(self):
+        binds = [None] + list(self.app.config.get('SQLALCHEMY_BINDS') or {})
+        return [db.get_engine(self.app, bind=bind) for bind in binds]
+
+    @staticmethod
+    def _capacity(pool):
+        if isinstance(pool, QueuePool):
+            return pool.size() + max(pool._max_overflow, 0)
+        return None
+
+    def record_checkout(self, pool, wait, timed_out=False):
+        metrics.observe_db_checkout(wait, timed_out)
+        with self._lock:
+            stats = self._stats.setdefault(id(pool), {
+                'checkouts': 0,
+                'timeouts': 0,
+                'wait_seconds': 0.0,
+                'max_wait_seconds': 0.0,
+            })
+            stats['checkouts'] += 1
+            stats['timeouts'] += timed_out
+            stats['wait_seconds'] += wait
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], wait)
+
+    def stats(self):
+        """Per-engine pool usage and checkout wait times for this process"""
+        result = {}
+        for engine in self.engines():
+            pool = engine.pool
+            with self._lock:
+                stats = dict(self._stats.get(id(pool), {}))
+            if isinstance(pool, QueuePool):
+                capacity = self._capacity(pool)
+                stats.update({
+                    'size': pool.size(),
+                    'checked_in': pool.checkedin(),
+                    'checked_out': pool.checkedout(),
+                    'overflow': pool.overflow(),
+                    'utilisation': pool.checkedout() / capacity if capacity else 0.0,
+                })
+            result[repr(engine.url)] = stats
+        return result
+
+
+pool_monitor = PoolMonitor()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_monitor.record_checkout(self, time.perf_counter() - started, timed_out=True)
+            raise
+        pool_monitor.record_checkout(self, time.perf_counter() - started)
+        return connection
+
+
+@event.listens_for(Pool, 'connect')
+def remember_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+
+@event.listens_for(Pool, 'checkout')
+def check_pid(dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info['pid'] != os.getpid():
+        # Opened before a fork: drop it instead of sharing the socket.
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+            f"Connection record belongs to pid {connection_record.info['pid']}, "
+            f"attempting to check out in pid {os.getpid()}"
+        )
+
+
+class ReplicaRouter:
+    """Picks a read replica for requests that opted in with `replica_reads`
+
+    Replicas come from `DATABASE_REPLICA_URIS` and are registered as
+    `replica_<n>` binds. A background thread in each process checks every
+    replica's health and lag each `REPLICA_CHECK_INTERVAL` seconds, so
+    requests only read its last result; replicas that fail the check, lag
+    more than `REPLICA_MAX_LAG` seconds or have not been checked yet are
+    skipped, and with none left reads go to the primary. After a commit
+    that wrote anything, the writer's reads stay on the primary for
+    `REPLICA_STICKY_SECONDS`; the marker lives in the user cache backend so
+    every worker sees it when that backend is shared.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.replicas = []
+        self.sticky = TwoLevelCache('primary')
+        self._state = {}
+        self._cycle = None
+        self._checker_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('DATABASE_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+        app.config.setdefault('REPLICA_MAX_LAG', 2)
+        app.config.setdefault('REPLICA_CHECK_INTERVAL', 5)
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        self.replicas = []
+        for i, uri in enumerate(app.config['DATABASE_REPLICA_URIS']):
+            name = f"replica_{i}"
+            binds[name] = uri
+            self.replicas.append(name)
+        app.config['SQLALCHEMY_BINDS'] = binds
+        self._state = {}
+        self._checker_pid = None
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+
+        sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        self.sticky.local = LRUCache(app.config.get('USER_CACHE_SIZE', 10000), sticky_seconds)
+        self.sticky.shared = create_backend(app.config.get('USER_CACHE_BACKEND'))
+        self.sticky.ttl = sticky_seconds
+
+    def mark_write(self):
+        if not self.replicas or not has_request_context():
+            return
+        identity = get_jwt_identity()
+        if identity is not None:
+            self.sticky.set(identity, True)
+
+    def engine_for_request(self):
+        """Replica engine for the current request, or None for the primary"""
+        if not self.replicas or not has_request_context() or not g.get('replica_reads'):
+            return None
+        if 'replica_engine' not in g:
+            g.replica_engine = None
+            identity = get_jwt_identity()
+            if identity is None or self.sticky.get(identity) is None:
+                name = self._choose()
+                if name is not None:
+                    g.replica_engine = db.get_engine(current_app, bind=name)
+        return g.replica_engine
+
+    def _choose(self):
+        self._ensure_checker()
+        for _ in range(len(self.replicas)):
+            name = next(self._cycle)
+            state = self._state.get(name)
+            if state is not None and state['healthy'] and state['lag'] <= self.app.config['REPLICA_MAX_LAG']:
+                return name
+        return None
+
+    def _ensure_checker(self):
+        # Started on first use rather than in init_app, so forked workers
+        # each run their own checker.
+        if self._checker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._checker_pid != os.getpid():
+                self._state = {}
+                threading.Thread(target=self._check_loop, name='replica-lag-checker', daemon=True).start()
+                self._checker_pid = os.getpid()
+
+    def _check_loop(self):
+        while True:
+            for name in self.replicas:
+                self._state[name] = self._check(name)
+            time.sleep(self.app.config['REPLICA_CHECK_INTERVAL'])
+
+    def _check(self, name):
+        started = time.monotonic()
+        try:
+            lag = self._measure_lag(db.get_engine(self.app, bind=name))
+            state = {'healthy': lag is not None, 'lag': lag, 'error': None}
+        except Exception as e:
+            state = {'healthy': False, 'lag': None, 'error': str(e)}
+        state['checked_at'] = started
+        return state
+
+    @staticmethod
+    def _measure_lag(engine):
+        """Seconds the replica is behind, or None when replication is stopped"""
+        with engine.connect() as connection:
+            if engine.dialect.name != 'mysql':
+                connection.execute(text('SELECT 1'))
+                return 0
+            try:
+                row = connection.execute(text('SHOW REPLICA STATUS')).first()
+                key = 'Seconds_Behind_Source'
+            except Exception:
+                row = connection.execute(text('SHOW SLAVE STATUS')).first()
+                key = 'Seconds_Behind_Master'
+            if row is None:
+                return 0
+            lag = row[key]
+            return None if lag is None else float(lag)
+
+    def stats(self):
+        return {name: dict(self._state.get(name, {})) for name in self.replicas}
+
+
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from a replica when the request allows it
+
+    Flushes, bulk saves and UPDATE/DELETE statements always go to the
+    primary, as does everything outside a `replica_reads` request.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        else:
+            engine = replica_router.engine_for_request()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def stick_to_primary(session):
+    if session.info.pop('wrote', False):
+        replica_router.mark_write()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_writes(session):
+    session.info.pop('wrote', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        super().apply_driver_hacks(app, sa_url, options)
+        if sa_url.drivername.startswith('mysql'):
+            options.setdefault('poolclass', TimedQueuePool)
+
 
 metadata = MetaData()
-db = SQLAlchemy(metadata=metadata)
+db = RoutingSQLAlchemy(metadata=metadata)
+
+
+def replica_reads(fn):
+    """Let the wrapped handler read from a replica; use below @jwt_required"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        g.replica_reads = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def reading_from_replica():
+    return has_request_context() and g.get('replica_engine') is not None
+
+
+class UnitOfWork:
+    """Writes collected for a single commit
+
+    Objects passed to `bulk_save` are written with `bulk_save_objects` right
+    before the commit instead of going through the unit of work one by one;
+    they skip ORM events and relationship handling, so use it for plain
+    many-row inserts and updates.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._bulk = []
+
+    def add(self, obj):
+        self.session.add(obj)
+
+    def bulk_save(self, objects):
+        self._bulk.extend(objects)
+
+    def flush(self):
+        if self._bulk:
+            self.session.bulk_save_objects(self._bulk, preserve_order=True)
+            self._bulk = []
+        self.session.flush()
+
+
+def current_unit_of_work():
+    if not has_app_context():
+        return None
+    return g.get('unit_of_work')
+
+
+@contextmanager
+def unit_of_work():
+    """Commit everything done inside the block once, or roll it all back
+
+    Model `save()`/`delete()`/`add()` calls inside the block only stage
+    their changes, and autoflush is off so nothing is sent to the database
+    until the block ends. Nested blocks join the outermost one. Also usable
+    as a decorator.
+    """
+    outer = current_unit_of_work()
+    if outer is not None:
+        yield outer
+        return
+
+    uow = UnitOfWork(db.session)
+    g.unit_of_work = uow
+    try:
+        with db.session.no_autoflush:
+            yield uow
+            uow.flush()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        g.unit_of_work = None
+
+
+def commit():
+    """Commit the session now, unless a unit of work will commit it later"""
+    if current_unit_of_work() is not None:
+        return
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,135 @@
+"""Live diagnostics for a single worker process
+
+`StackSampler` records the stacks of every other thread in the process at
+a fixed interval from a background thread and writes them in collapsed
+format (`frame;frame;frame count` per line), ready for flamegraph.pl or
+speedscope. Profiles go to `DIAGNOSTICS_DIR`, which every worker shares, so
+any worker can serve a profile taken in another. Under uWSGI the sampler
+thread needs `enable-threads`.
+"""
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from flask import g, request
+
+
+def collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, path, seconds, interval):
+        super().__init__(name='diagnostics-sampler', daemon=True)
+        self.path = path
+        self.seconds = seconds
+        self.interval = interval
+        self.samples = Counter()
+
+    def run(self):
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self.samples[f"{names.get(ident, ident)};{collapse(frame)}"] += 1
+            time.sleep(self.interval)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, self.path)
+
+
+class Diagnostics:
+    def __init__(self, app=None):
+        self.app = app
+        self._sampler = None
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('DIAGNOSTICS_DIR', '/tmp/flapisk-diagnostics')
+        app.config.setdefault('DIAGNOSTICS_MAX_SECONDS', 60)
+        app.config.setdefault('DIAGNOSTICS_SAMPLE_INTERVAL_MS', 10)
+        app.before_request(self._request_started)
+        app.teardown_request(self._request_finished)
+
+    def _request_started(self):
+        g.diagnostics_key = threading.get_ident()
+        self._in_flight[g.diagnostics_key] = {
+            'method': request.method,
+            'path': request.path,
+            'started': time.time(),
+        }
+
+    def _request_finished(self, exc):
+        key = g.pop('diagnostics_key', None)
+        if key is not None:
+            self._in_flight.pop(key, None)
+
+    def start_profile(self, seconds, interval_ms):
+        """Start sampling this worker; returns the profile name, or None if one is running"""
+        with self._lock:
+            if self._sampler is not None and self._sampler.is_alive():
+                return None
+            directory = self.app.config['DIAGNOSTICS_DIR']
+            os.makedirs(directory, exist_ok=True)
+            name = f"profile-{os.getpid()}-{int(time.time())}.collapsed"
+            self._sampler = StackSampler(os.path.join(directory, name), seconds, interval_ms / 1000)
+            self._sampler.start()
+            return name
+
+    def profile_path(self, name):
+        """Path of a finished profile, or None; `name` comes from the client"""
+        if os.path.basename(name) != name or not name.endswith('.collapsed'):
+            return None
+        path = os.path.join(self.app.config['DIAGNOSTICS_DIR'], name)
+        return path if os.path.isfile(path) else None
+
+    def in_flight(self):
+        now = time.time()
+        return [
+            dict(entry, elapsed_seconds=round(now - entry['started'], 3))
+            for entry in list(self._in_flight.values())
+        ]
+
+    @staticmethod
+    def thread_stacks():
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        return {
+            f"{names.get(ident, 'unknown')} ({ident})": traceback.format_stack(frame)
+            for ident, frame in sys._current_frames().items()
+        }
+
+    def state(self):
+        from src.services.cache import user_cache
+        from src.services.db import pool_monitor, replica_router
+        from src.services.hasher import hasher
+        from src.services.revocation import revocation_index
+        return {
+            'pid': os.getpid(),
+            'db_pool': pool_monitor.stats(),
+            'replicas': replica_router.stats(),
+            'user_cache': user_cache.stats(),
+            'hash_pool': hasher.stats(),
+            'revocation_index': revocation_index.stats(),
+            'in_flight': self.in_flight(),
+            'threads': self.thread_stacks(),
+        }
+
+
+diagnostics = Diagnostics()
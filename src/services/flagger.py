@@ -1,4 +1,18 @@
-from flasgger import Swagger
+"""API documentation, generated by flasgger or prebuilt by `flask docs build`
+
+With SWAGGER_ENABLED, flasgger serves the UI and builds the spec from the
+resource docstrings at runtime. Otherwise the spec written by
+`flask docs build` is served from DOCS_DIR: the versioned file, named after
+the API version and a hash of its content, is cached for a year, and the
+stable spec route serves the same bytes for clients to revalidate with
+its ETag. Nothing imports flasgger or parses a docstring in that mode.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from flask import Blueprint, Response, abort, current_app, request, url_for
 
 swagger_config = {
     "openapi": "3.0.2",
@@ -16,7 +30,7 @@ swagger_config = {
         {
             "endpoint": "swagger",
             "route": "/docs/swagger.json",
-            "rule_filter": lambda rule: True,  # all in
+            "rule_filter": lambda rule: rule.rule.startswith('/api/'),
             "model_filter": lambda tag: True,  # all in
         }
     ],
@@ -27,6 +41,100 @@ swagger_config = {
     "swagger_ui": True,
 }
 
-swagger = Swagger(
-    config=swagger_config,
-)
+MANIFEST = 'manifest.json'
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+docs_blueprint = Blueprint('docs', __name__)
+
+
+class LazySwagger:
+    """Imports flasgger, which is slow to import, only for apps serving docs"""
+
+    def __init__(self, config):
+        self.config = config
+        self.swagger = None
+        self._prebuilt = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('SWAGGER_ENABLED', True)
+        app.config.setdefault('DOCS_DIR', os.path.join(os.path.dirname(app.root_path), 'static', 'docs'))
+        app.config.setdefault('DOCS_MAX_AGE', 300)
+        self._prebuilt = None
+        if not app.config['SWAGGER_ENABLED']:
+            app.register_blueprint(docs_blueprint)
+            return
+
+        from flasgger import Swagger
+        self.swagger = Swagger(config=self.config)
+        self.swagger.init_app(app)
+
+    def build_spec(self, app):
+        """The OpenAPI document for `app`, parsed from the resource docstrings"""
+        if self.swagger is None:
+            from flasgger import Swagger
+            self.swagger = Swagger(app, config=self.config)
+        with app.test_request_context():
+            return self.swagger.get_apispecs(self.config['specs'][0]['endpoint'])
+
+    def write_spec(self, spec, directory):
+        """Write `spec` to a versioned file and point the manifest at it"""
+        body = json.dumps(spec, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        name = f"openapi-{spec['info']['version']}-{digest}.json"
+
+        os.makedirs(directory, exist_ok=True)
+        for filename, content in ((name, body), (MANIFEST, json.dumps({'file': name, 'etag': digest}).encode())):
+            tmp_path = os.path.join(directory, f"{filename}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, os.path.join(directory, filename))
+        return name
+
+    def prebuilt(self):
+        """(file name, body, etag) of the prebuilt spec, or None
+
+        Read once per process; a new build is picked up by restarting.
+        """
+        if self._prebuilt is None:
+            with self._lock:
+                if self._prebuilt is None:
+                    directory = current_app.config['DOCS_DIR']
+                    try:
+                        with open(os.path.join(directory, MANIFEST)) as f:
+                            manifest = json.load(f)
+                        with open(os.path.join(directory, manifest['file']), 'rb') as f:
+                            self._prebuilt = (manifest['file'], f.read(), manifest['etag'])
+                    except (OSError, ValueError, KeyError):
+                        return None
+        return self._prebuilt
+
+
+swagger = LazySwagger(swagger_config)
+
+
+def spec_response(body, etag, cache_control):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+
+@docs_blueprint.route(swagger_config['specs'][0]['route'])
+def serve_spec():
+    prebuilt = swagger.prebuilt()
+    if prebuilt is None:
+        abort(404)
+    name, body, etag = prebuilt
+    response = spec_response(body, etag, f"public, max-age={current_app.config['DOCS_MAX_AGE']}")
+    response.headers['Content-Location'] = url_for('docs.serve_versioned_spec', name=name)
+    return response
+
+
+@docs_blueprint.route('/docs/<name>')
+def serve_versioned_spec(name):
+    prebuilt = swagger.prebuilt()
+    if prebuilt is None or name != prebuilt[0]:
+        abort(404)
+    _, body, etag = prebuilt
+    return spec_response(body, etag, f"public, max-age={IMMUTABLE_MAX_AGE}, immutable")
@@ -0,0 +1,230 @@
+"""Bounded worker pool for password hashing
+
+PBKDF2 runs in a process pool instead of the request worker. Admission is
+bounded host-wide by a fixed number of slot lock files shared by every
+uWSGI worker: when all slots are held, callers get `HashPoolSaturated`
+straight away instead of queueing behind a burst of logins. A slot held
+by a crashed process is released by the kernel together with its lock.
+flock does not exclude threads sharing the descriptor, so each slot also
+has a thread lock. A hash that outlives `HASH_POOL_TIMEOUT` is reported as
+saturation as well.
+
+Every uWSGI worker starts its own pool, so unless `HASH_POOL_WORKERS` is
+set the host's CPUs are split between the uWSGI processes.
+"""
+import fcntl
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from src.services.metrics import metrics
+from src.services.tracing import tracer
+
+
+class HashPoolSaturated(Exception):
+    pass
+
+
+def default_workers():
+    """CPUs per web worker, as every uWSGI worker starts its own pool"""
+    cpus = os.cpu_count() or 1
+    try:
+        import uwsgi
+    except ImportError:
+        return cpus
+    return max(1, cpus // uwsgi.numproc)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class HashExecutor:
+    def __init__(self, app=None):
+        self.app = app
+        self._pool = None
+        self._slots = []
+        self._slot_locks = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        cpus = os.cpu_count() or 1
+        app.config.setdefault('HASH_POOL_WORKERS', None)
+        app.config.setdefault('HASH_POOL_QUEUE_SIZE', cpus * 2)
+        app.config.setdefault('HASH_POOL_TIMEOUT', 5)
+        app.config.setdefault('HASH_POOL_LOCK_DIR', '/tmp/flapisk-hash-slots')
+        app.config.setdefault('HASH_POOL_MAP_CHUNK', cpus * 4)
+        self._pid = None
+
+    def _ensure_process(self):
+        if self._pid == os.getpid():
+            return
+        for fd in self._slots:
+            os.close(fd)
+        self._slot_locks = {}
+
+        lock_dir = self.app.config['HASH_POOL_LOCK_DIR']
+        os.makedirs(lock_dir, exist_ok=True)
+        self._slots = [
+            os.open(os.path.join(lock_dir, f"slot-{i}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            for i in range(self.app.config['HASH_POOL_QUEUE_SIZE'])
+        ]
+        self._slot_locks = {fd: threading.Lock() for fd in self._slots}
+        workers = self.app.config['HASH_POOL_WORKERS']
+        workers = default_workers() if workers is None else int(workers)
+        self._pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._stats = {}
+        self._pid = os.getpid()
+
+    def _acquire_slot(self):
+        for fd in self._slots:
+            thread_lock = self._slot_locks[fd]
+            if not thread_lock.acquire(blocking=False):
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                thread_lock.release()
+        raise HashPoolSaturated("Password hashing queue is full")
+
+    def _release_slot(self, fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        self._slot_locks[fd].release()
+
+    def _release_when_done(self, slot, futures):
+        """Release `slot` once every one of `futures` has finished
+
+        Used when the caller gives up on a chunk early: the hashes keep running
+        in their pool processes, and the slot stays taken until they end so
+        pool work never outgrows the slots.
+        """
+        if not futures:
+            self._release_slot(slot)
+            return
+        for future in futures:
+            future.cancel()
+        pending = [len(futures)]
+        lock = threading.Lock()
+
+        def finished(future):
+            with lock:
+                pending[0] -= 1
+                last = pending[0] == 0
+            if last:
+                self._release_slot(slot)
+
+        for future in futures:
+            future.add_done_callback(finished)
+
+    def run(self, name, fn, *args):
+        """Run `fn(*args)` in the pool, or inline when the pool is disabled"""
+        if self.app is None:
+            return fn(*args)
+
+        self._ensure_process()
+        slot = self._acquire_slot()
+        started = time.perf_counter()
+        with tracer.span(f"hash.{name}"):
+            if self._pool is None:
+                try:
+                    result, compute = _timed(fn, *args)
+                finally:
+                    self._release_slot(slot)
+            else:
+                try:
+                    future = self._pool.submit(_timed, fn, *args)
+                except Exception:
+                    self._release_slot(slot)
+                    raise
+                try:
+                    result, compute = future.result(timeout=self.app.config['HASH_POOL_TIMEOUT'])
+                except TimeoutError:
+                    self._release_when_done(slot, [future])
+                    raise HashPoolSaturated("Password hashing timed out")
+                except BaseException:
+                    self._release_slot(slot)
+                    raise
+                self._release_slot(slot)
+        self._record(name, time.perf_counter() - started, compute)
+        return result
+
+    def map(self, name, fn, items):
+        """Run `fn` over `items` in the pool, one admission slot per chunk
+
+        Each chunk of `HASH_POOL_MAP_CHUNK` items takes and releases its own
+        slot, so a large batch competes with sign-ins chunk by chunk instead
+        of holding a slot for the whole batch.
+        """
+        items = list(items)
+        if self.app is None or not items:
+            return [fn(item) for item in items]
+
+        self._ensure_process()
+        chunk = self.app.config['HASH_POOL_MAP_CHUNK']
+        results = []
+        started = time.perf_counter()
+        with tracer.span(f"hash.{name}", items=len(items)):
+            for i in range(0, len(items), chunk):
+                batch = items[i:i + chunk]
+                slot = self._acquire_slot()
+                if self._pool is None:
+                    try:
+                        results.extend(fn(item) for item in batch)
+                    finally:
+                        self._release_slot(slot)
+                    continue
+
+                futures = []
+                deadline = time.monotonic() + self.app.config['HASH_POOL_TIMEOUT']
+                try:
+                    for item in batch:
+                        futures.append(self._pool.submit(fn, item))
+                    for future in futures:
+                        results.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+                except TimeoutError:
+                    self._release_when_done(slot, futures)
+                    raise HashPoolSaturated("Password hashing timed out")
+                except BaseException:
+                    # The rest of the chunk may still be running
+                    self._release_when_done(slot, futures)
+                    raise
+                self._release_slot(slot)
+        elapsed = time.perf_counter() - started
+        self._record(name, elapsed, elapsed)
+        return results
+
+    def _record(self, name, total, compute):
+        metrics.observe_hash(name, total)
+        with self._lock:
+            stats = self._stats.setdefault(name, {
+                'calls': 0,
+                'total_seconds': 0.0,
+                'compute_seconds': 0.0,
+                'max_seconds': 0.0,
+            })
+            stats['calls'] += 1
+            stats['total_seconds'] += total
+            stats['compute_seconds'] += compute
+            stats['max_seconds'] = max(stats['max_seconds'], total)
+
+    def stats(self):
+        """Per-operation call counts and timings for this process
+
+        `total_seconds - compute_seconds` is time spent waiting for a pool
+        process and moving arguments across, which is what grows when the
+        pool is undersized.
+        """
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+hasher = HashExecutor()
@@ -1,3 +1,15 @@
+from flask import current_app
 from flask_jwt_extended import JWTManager
 
 jwt = JWTManager()
+
+
+@jwt.token_in_blacklist_loader
+def check_if_token_in_blacklist(decrypted_token):
+    from src.services.revocation import revocation_index, token_generations
+    identity = decrypted_token[current_app.config['JWT_IDENTITY_CLAIM']]
+    claims = decrypted_token.get(current_app.config['JWT_USER_CLAIMS'], {})
+    if token_generations.is_stale(identity, claims):
+        return True
+    jti = decrypted_token['jti']
+    return revocation_index.is_revoked(jti)
@@ -0,0 +1,159 @@
+"""Per-process mailer with a cached template environment and SES client
+
+The jinja2 environment is built once per process and keeps compiled
+templates in memory; with MAIL_TEMPLATE_CACHE_DIR set, compiled bytecode is
+also cached on disk and shared by every worker. The SES client is created
+once per process with a connection pool and reused for every send.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+
+import jinja2
+
+from src.services.metrics import metrics
+from src.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class StubSESClient:
+    """Stands in for the SES client when SES_STUB is set
+
+    Messages are kept in `sent` instead of leaving the machine, so the email
+    path can be exercised offline.
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def send_email(self, Destination, Source, Message):
+        message_id = str(uuid.uuid4())
+        self.sent.append({
+            'MessageId': message_id,
+            'Destination': Destination,
+            'Source': Source,
+            'Message': Message,
+        })
+        logger.info("SES stub accepted email to %s", Destination['ToAddresses'])
+        return {'MessageId': message_id}
+
+
+ses_stub = StubSESClient()
+
+
+class Mailer:
+    def __init__(self, app=None):
+        self.app = app
+        self._env = None
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('MAIL_TEMPLATE_CACHE_DIR', None)
+        app.config.setdefault('SES_MAX_POOL_CONNECTIONS', 10)
+        self._env = None
+        self._client = None
+        self._pid = None
+
+    def _check_process(self):
+        # boto3 clients hold sockets and must not be shared across a fork.
+        if self._pid != os.getpid():
+            self._client = None
+            self._pid = os.getpid()
+
+    @property
+    def template_env(self):
+        if self._env is None:
+            with self._lock:
+                if self._env is None:
+                    bytecode_cache = None
+                    cache_dir = self.app.config['MAIL_TEMPLATE_CACHE_DIR']
+                    if cache_dir:
+                        os.makedirs(cache_dir, exist_ok=True)
+                        bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+                    self._env = jinja2.Environment(
+                        loader=jinja2.FileSystemLoader(searchpath=self.app.config['TEMPLATES_DIR']),
+                        bytecode_cache=bytecode_cache,
+                        auto_reload=self.app.config.get('DEBUG', False),
+                        cache_size=-1,
+                    )
+        return self._env
+
+    @property
+    def client(self):
+        self._check_process()
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        if self.app.config.get('SES_STUB'):
+            return ses_stub
+
+        import boto3
+        from botocore.config import Config
+        client_config = Config(
+            max_pool_connections=self.app.config['SES_MAX_POOL_CONNECTIONS'],
+            retries={'max_attempts': 3, 'mode': 'standard'},
+        )
+        if 'AWS_EXECUTION_ENV' in os.environ:
+            return boto3.client('ses', config=client_config)
+        return boto3.client(
+            'ses',
+            region_name=self.app.config['AWS_REGION'],
+            aws_access_key_id=self.app.config['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=self.app.config['AWS_SECRET_ACCESS_KEY'],
+            config=client_config,
+        )
+
+    def render(self, template_name, **context):
+        return self.template_env.get_template(template_name).render(**context)
+
+    def send(self, to_addresses, subject, html_content, source=None):
+        message = {
+            'Body': {'Html': {'Charset': "UTF-8", 'Data': html_content}},
+            'Subject': {'Charset': "UTF-8", 'Data': subject},
+        }
+        started = time.perf_counter()
+        ok = False
+        try:
+            with tracer.span('ses.send_email', recipients=len(to_addresses)):
+                response = self.client.send_email(
+                    Destination={'ToAddresses': to_addresses},
+                    Source=source or self.app.config['SERVICE_EMAIL'],
+                    Message=message,
+                )
+            ok = True
+            return response
+        finally:
+            metrics.observe_ses_send(time.perf_counter() - started, ok)
+
+    def send_batch(self, template_name, subject, recipients):
+        """Render one template for many recipients and send each message
+
+        `recipients` is an iterable of (to_address, context) pairs. The
+        template is compiled once and the pooled client reused, so the
+        setup cost is paid once for the whole batch. Returns one
+        (to_address, response or exception) pair per recipient.
+        """
+        template = self.template_env.get_template(template_name)
+        results = []
+        for to_address, context in recipients:
+            try:
+                response = self.send([to_address], subject, template.render(**context))
+            except Exception as e:
+                response = e
+            results.append((to_address, response))
+        return results
+
+
+mailer = Mailer()
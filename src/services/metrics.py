@@ -0,0 +1,219 @@
+"""Prometheus metrics for routes, database pool, hashing, email and Celery
+
+With `METRICS_MULTIPROC_DIR` set, every uWSGI worker writes its samples to
+mmap files in that directory and `/metrics` aggregates all of them, so a
+scrape served by any worker covers the whole host. The directory must be
+emptied when the server starts (see flapisk.ini). Without it, samples are
+kept in memory and only describe the process serving the scrape.
+
+`/metrics` answers scrapers from `METRICS_ALLOWED_IPS` (addresses or
+networks, loopback by default) and requests bearing `METRICS_TOKEN`.
+"""
+import atexit
+import hmac
+import ipaddress
+import logging
+import os
+import time
+from functools import wraps
+
+from flask import Response, abort, g, request
+
+logger = logging.getLogger(__name__)
+
+
+class QueueDepthCollector:
+    """Reads Celery queue lengths from the Redis broker at scrape time"""
+
+    def __init__(self, broker_url, queues):
+        self.broker_url = broker_url
+        self.queues = queues
+        self._client = None
+        self._redis_missing = False
+
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+        gauge = GaugeMetricFamily('flapisk_celery_queue_depth', 'Tasks waiting in a Celery queue',
+                                  labels=['queue'])
+        if self._redis_missing:
+            yield gauge
+            return
+        try:
+            if self._client is None:
+                import redis
+                self._client = redis.Redis.from_url(self.broker_url, socket_timeout=1)
+            for queue in self.queues:
+                gauge.add_metric([queue], self._client.llen(queue))
+        except ImportError:
+            logger.warning("redis is not installed; Celery queue depth is not reported")
+            self._redis_missing = True
+        except Exception as e:
+            logger.warning("Celery queue depth unavailable: %s", e)
+            self._client = None
+        yield gauge
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = False
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_MULTIPROC_DIR', None)
+        app.config.setdefault('METRICS_CELERY_BROKER_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('METRICS_CELERY_QUEUES', ['celery'])
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+        self.enabled = app.config['METRICS_ENABLED']
+        if not self.enabled:
+            return
+        self.allowed_networks = [
+            ipaddress.ip_network(address.strip()) for address in app.config['METRICS_ALLOWED_IPS'] if address.strip()
+        ]
+
+        multiproc_dir = app.config['METRICS_MULTIPROC_DIR']
+        if multiproc_dir:
+            os.makedirs(multiproc_dir, exist_ok=True)
+            # prometheus_client picks its value storage when first imported.
+            os.environ.setdefault('prometheus_multiproc_dir', multiproc_dir)
+        self.multiprocess = 'prometheus_multiproc_dir' in os.environ
+
+        from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+        self.registry = CollectorRegistry()
+        self.request_seconds = Histogram(
+            'flapisk_http_request_duration_seconds', 'Request latency by resource',
+            ['resource', 'method'], registry=self.registry
+        )
+        self.requests = Counter(
+            'flapisk_http_requests_total', 'Requests by resource and status code',
+            ['resource', 'method', 'status'], registry=self.registry
+        )
+        self.in_flight = Gauge(
+            'flapisk_http_requests_in_flight', 'Requests being handled',
+            ['resource'], registry=self.registry, multiprocess_mode='livesum'
+        )
+        self.db_checkout_seconds = Histogram(
+            'flapisk_db_pool_checkout_seconds', 'Time waiting for a pooled connection',
+            buckets=(.0005, .001, .005, .01, .05, .1, .5, 1, 5, 10), registry=self.registry
+        )
+        self.db_checkout_timeouts = Counter(
+            'flapisk_db_pool_checkout_timeouts_total', 'Checkouts that timed out',
+            registry=self.registry
+        )
+        self.db_pool = Gauge(
+            'flapisk_db_pool_connections', 'Pooled connections by state',
+            ['state'], registry=self.registry, multiprocess_mode='livesum'
+        )
+        self.hash_seconds = Histogram(
+            'flapisk_password_hash_seconds', 'PBKDF2 hashing time including pool wait',
+            ['operation'], buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5), registry=self.registry
+        )
+        self.ses_send_seconds = Histogram(
+            'flapisk_ses_send_seconds', 'SES send_email latency',
+            ['outcome'], registry=self.registry
+        )
+        self.queue_depth = QueueDepthCollector(
+            app.config['METRICS_CELERY_BROKER_URL'],
+            app.config['METRICS_CELERY_QUEUES']
+        )
+        if not self.multiprocess:
+            self.registry.register(self.queue_depth)
+
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _check_process(self):
+        if self.multiprocess and self._pid != os.getpid():
+            from prometheus_client import multiprocess
+            atexit.register(multiprocess.mark_process_dead, os.getpid())
+            self._pid = os.getpid()
+
+    def track_resource(self, view):
+        """ApiRouter decorator marking the request as handled by a resource
+
+        Latency and status are recorded once the final response is known,
+        so errors turned into responses by the JWT and API error handlers
+        are counted with their real status code.
+        """
+        resource = getattr(view, 'view_class', view).__name__
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.enabled and 'metrics_resource' not in g:
+                self._check_process()
+                g.metrics_resource = resource
+                g.metrics_started = time.perf_counter()
+                self.in_flight.labels(resource).inc()
+            return view(*args, **kwargs)
+        return wrapper
+
+    def _after_request(self, response):
+        self._finish_request(response.status_code)
+        self._record_pool()
+        return response
+
+    def _teardown_request(self, exc):
+        # Only still pending when the request ended in an unhandled error.
+        self._finish_request(500)
+
+    def _finish_request(self, status):
+        resource = g.pop('metrics_resource', None)
+        if resource is None:
+            return
+        self.request_seconds.labels(resource, request.method).observe(time.perf_counter() - g.metrics_started)
+        self.requests.labels(resource, request.method, str(status)).inc()
+        self.in_flight.labels(resource).dec()
+
+    def _record_pool(self):
+        from src.services.db import db
+        pool = db.engine.pool
+        if hasattr(pool, 'checkedout'):
+            self.db_pool.labels('checked_out').set(pool.checkedout())
+            self.db_pool.labels('checked_in').set(pool.checkedin())
+            self.db_pool.labels('overflow').set(max(pool.overflow(), 0))
+
+    def observe_db_checkout(self, seconds, timed_out=False):
+        if self.enabled:
+            self.db_checkout_seconds.observe(seconds)
+            if timed_out:
+                self.db_checkout_timeouts.inc()
+
+    def observe_hash(self, operation, seconds):
+        if self.enabled:
+            self.hash_seconds.labels(operation).observe(seconds)
+
+    def observe_ses_send(self, seconds, ok):
+        if self.enabled:
+            self.ses_send_seconds.labels('ok' if ok else 'error').observe(seconds)
+
+    def _scrape_allowed(self):
+        token = self.app.config['METRICS_TOKEN']
+        auth = request.headers.get('Authorization', '')
+        if token and hmac.compare_digest(auth.encode(), f"Bearer {token}".encode()):
+            return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr)
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    def export(self):
+        if not self._scrape_allowed():
+            abort(403)
+        from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest
+        registry = self.registry
+        if self.multiprocess:
+            from prometheus_client import multiprocess
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            registry.register(self.queue_depth)
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+metrics = Metrics()
@@ -0,0 +1,117 @@
+"""Per-request SQL query profiling
+
+When `QUERY_PROFILER_ENABLED` is set, every statement run while handling a
+request is timed through the engine's cursor events. Each response gets a
+`Server-Timing` header with the query count and database time, requests
+slower than `QUERY_PROFILER_SLOW_REQUEST_MS` are logged with their slowest
+statements, and a statement repeated `QUERY_PROFILER_REPEAT_THRESHOLD`
+times or more within one request is reported as a likely N+1.
+"""
+import logging
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfile:
+    def __init__(self, keep):
+        self.started = time.perf_counter()
+        self.keep = keep
+        self.count = 0
+        self.db_seconds = 0.0
+        self.slowest = []
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.db_seconds += seconds
+        self.statements[statement] += 1
+        if len(self.slowest) < self.keep or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.keep:]
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+class QueryProfiler:
+    def __init__(self, app=None):
+        self.app = app
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('QUERY_PROFILER_ENABLED', False)
+        app.config.setdefault('QUERY_PROFILER_SLOW_REQUEST_MS', 500)
+        app.config.setdefault('QUERY_PROFILER_SLOW_QUERY_MS', 100)
+        app.config.setdefault('QUERY_PROFILER_REPEAT_THRESHOLD', 5)
+        app.config.setdefault('QUERY_PROFILER_TOP_QUERIES', 3)
+        if not app.config['QUERY_PROFILER_ENABLED']:
+            return
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+            event.listen(Engine, 'handle_error', self._execute_failed)
+            self._listening = True
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        g.query_profile = RequestProfile(self.app.config['QUERY_PROFILER_TOP_QUERIES'])
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['query_started'].pop()
+        if not has_request_context() or 'query_profile' not in g:
+            return
+        g.query_profile.record(statement, seconds)
+        if seconds * 1000 >= self.app.config['QUERY_PROFILER_SLOW_QUERY_MS']:
+            logger.warning("Slow query (%.1f ms) in %s %s: %s",
+                           seconds * 1000, request.method, request.path, statement)
+
+    @staticmethod
+    def _execute_failed(exception_context):
+        # A failed statement never reaches after_cursor_execute; drop its
+        # start time so the stack does not grow on a pooled connection.
+        connection = exception_context.connection
+        if connection is not None and exception_context.execution_context is not None:
+            started = connection.info.get('query_started')
+            if started:
+                started.pop()
+
+    def _finish(self, response):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return response
+
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        db_ms = profile.db_seconds * 1000
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={db_ms:.1f};desc="{profile.count} queries", app;dur={total_ms:.1f}'
+        )
+
+        endpoint = f"{request.method} {request.path}"
+        for statement, count in profile.repeated(self.app.config['QUERY_PROFILER_REPEAT_THRESHOLD']):
+            logger.warning("Possible N+1 in %s: %d executions of %s", endpoint, count, statement)
+
+        if total_ms >= self.app.config['QUERY_PROFILER_SLOW_REQUEST_MS']:
+            slowest = "\n".join(f"  {seconds * 1000:.1f} ms  {statement}" for seconds, statement in profile.slowest)
+            logger.warning("Slow request %s: %.1f ms, %d queries, %.1f ms in db\n%s",
+                           endpoint, total_ms, profile.count, db_ms, slowest)
+        return response
+
+
+query_profiler = QueryProfiler()
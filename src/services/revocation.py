@@ -0,0 +1,361 @@
+"""Shared revocation index for JWT blacklist checks
+
+Every uWSGI worker on a host maps the same bloom filter file, so a token
+revoked in one worker is visible to all of them straight away. Each worker
+also keeps an exact set of revoked identifiers, synced incrementally from
+the `revoked_tokens` table by `id` high-water mark. A bloom filter miss
+answers without touching the database; a hit is confirmed against the
+exact set, which is only refreshed when the hit is not already known.
+Identifiers leave the exact set once their token has expired, since an
+expired token is rejected before the blacklist is consulted.
+
+The file is local to a host (or a Lambda container), so each worker also
+syncs at least every `REVOCATION_SYNC_INTERVAL` seconds to pick up tokens
+revoked elsewhere. Every `REVOCATION_REBUILD_INTERVAL` seconds a worker
+rebuilds the filter from the unexpired rows and swaps it in, so false
+positives do not pile up as old revocations are pruned; the other workers
+map the new file at their next sync.
+
+Revoking every session of a user does not go through this index at all:
+`TokenGenerations` compares a generation claim carried by the token with
+the user's current `token_generation`.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import or_
+
+from src.services.cache import LRUCache
+
+
+class BloomFilter:
+    """Bloom filter stored in a memory-mapped file shared between processes
+
+    The header records when the file was built and the highest
+    `revoked_tokens.id` a rebuild put in it.
+    """
+
+    MAGIC = b'FLPRVK02'
+    HEADER = struct.Struct('<8sQQdQ')
+
+    def __init__(self, path, bits, hashes):
+        self.path = path
+        self.bits = bits
+        self.hashes = hashes
+        self.size = self.HEADER.size + (bits + 7) // 8
+        self._fd = self._open_locked()
+        try:
+            if not self._is_valid():
+                self._reset()
+            self._mmap = mmap.mmap(self._fd, self.size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _open_locked(self):
+        """Open and lock the file currently at `path`
+
+        Another worker may swap in a new file while we wait for the lock;
+        the lock we got then belongs to the old, unlinked file, so open
+        the path again until the locked file is the one at `path`.
+        """
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    def _is_valid(self):
+        if os.fstat(self._fd).st_size != self.size:
+            return False
+        magic, bits, hashes, _, _ = self.HEADER.unpack(os.pread(self._fd, self.HEADER.size, 0))
+        return (magic, bits, hashes) == (self.MAGIC, self.bits, self.hashes)
+
+    def _write(self, keys, high_water):
+        # Build the new file aside and swap it in, so workers still mapping
+        # an old file never see it shrink underneath them.
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w+b') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.bits, self.hashes, time.time(), high_water))
+            f.truncate(self.size)
+            f.flush()
+            with mmap.mmap(f.fileno(), self.size) as bits:
+                for key in keys:
+                    self._set(bits, key)
+        os.replace(tmp_path, self.path)
+
+    def _reset(self):
+        self._write((), 0)
+        os.close(self._fd)
+        self._fd = self._open_locked()
+
+    def rebuild(self, keys, high_water):
+        """Swap in a new file holding only `keys`; this instance keeps the old one"""
+        self._write(keys, high_water)
+
+    def is_current(self):
+        """False once another file has been swapped in at `path`"""
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self._fd).st_ino
+        except FileNotFoundError:
+            return False
+
+    @property
+    def built_at(self):
+        return self.HEADER.unpack_from(self._mmap)[3]
+
+    @property
+    def high_water(self):
+        return self.HEADER.unpack_from(self._mmap)[4]
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def _set(self, bits, key):
+        offset = self.HEADER.size
+        for position in self._positions(key):
+            index = offset + (position >> 3)
+            bits[index] = bits[index] | (1 << (position & 7))
+
+    def __contains__(self, key):
+        offset = self.HEADER.size
+        for position in self._positions(key):
+            if not self._mmap[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            self._set(self._mmap, key)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self._mmap.close()
+        os.close(self._fd)
+
+
+class RevocationIndex:
+    def __init__(self, app=None):
+        self.app = app
+        self._bloom = None
+        self._pid = None
+        self._revoked = {}
+        self._high_water = 0
+        self._loaded = False
+        self._synced_at = 0
+        self._pruned_at = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('REVOCATION_INDEX_PATH', '/tmp/flapisk-revoked.bloom')
+        app.config.setdefault('REVOCATION_BLOOM_BITS', 1 << 23)
+        app.config.setdefault('REVOCATION_BLOOM_HASHES', 7)
+        app.config.setdefault('REVOCATION_SYNC_BATCH', 10000)
+        app.config.setdefault('REVOCATION_SYNC_INTERVAL', 5)
+        app.config.setdefault('REVOCATION_REBUILD_INTERVAL', 60 * 60)
+        app.config.setdefault('REVOCATION_PRUNE_INTERVAL', 60)
+        self._pid = None
+
+    def _open(self):
+        return BloomFilter(
+            self.app.config['REVOCATION_INDEX_PATH'],
+            self.app.config['REVOCATION_BLOOM_BITS'],
+            self.app.config['REVOCATION_BLOOM_HASHES']
+        )
+
+    @property
+    def bloom(self):
+        # Open lazily and per process, so a master that forks workers after
+        # create_app never hands them a shared file descriptor.
+        if self._pid != os.getpid():
+            if self._bloom is not None:
+                self._bloom.close()
+            self._bloom = self._open()
+            self._revoked = {}
+            self._high_water = 0
+            self._loaded = False
+            self._synced_at = 0
+            self._pid = os.getpid()
+        return self._bloom
+
+    def _reopen(self):
+        """Map the file swapped in by a rebuild
+
+        Rows revoked after the rebuild read the table are not in it, so the
+        next sync starts again from the high-water mark it records.
+        """
+        self._bloom.close()
+        self._bloom = self._open()
+        self._high_water = min(self._high_water, self._bloom.high_water)
+
+    def _live_rows(self):
+        from src.models.revoked_tokens import RevokedTokenModel
+
+        now = datetime.utcnow()
+        batch = self.app.config['REVOCATION_SYNC_BATCH']
+        after = 0
+        while True:
+            rows = RevokedTokenModel.query \
+                .with_entities(RevokedTokenModel.id, RevokedTokenModel.jti) \
+                .filter(RevokedTokenModel.id > after) \
+                .filter(or_(RevokedTokenModel.expires_at.is_(None), RevokedTokenModel.expires_at > now)) \
+                .order_by(RevokedTokenModel.id) \
+                .limit(batch) \
+                .all()
+            yield from rows
+            if len(rows) < batch:
+                break
+            after = rows[-1][0]
+
+    def _rebuild(self):
+        """Rebuild the shared filter from the unexpired revocations"""
+        high_water = 0
+        jtis = []
+        for id, jti in self._live_rows():
+            jtis.append(jti)
+            high_water = id
+        self._bloom.rebuild(jtis, high_water)
+        self._reopen()
+
+    def sync(self):
+        """Pull revoked tokens added since the last sync into the index"""
+        from src.models.revoked_tokens import RevokedTokenModel
+
+        self.bloom  # opens the filter in this process
+        batch = self.app.config['REVOCATION_SYNC_BATCH']
+        with self._lock:
+            if not self._bloom.is_current():
+                self._reopen()
+            elif time.time() - self._bloom.built_at >= self.app.config['REVOCATION_REBUILD_INTERVAL']:
+                self._rebuild()
+
+            now = datetime.utcnow()
+            while True:
+                rows = RevokedTokenModel.query \
+                    .with_entities(RevokedTokenModel.id, RevokedTokenModel.jti, RevokedTokenModel.expires_at) \
+                    .filter(RevokedTokenModel.id > self._high_water) \
+                    .order_by(RevokedTokenModel.id) \
+                    .limit(batch) \
+                    .all()
+                for id, jti, expires_at in rows:
+                    self._high_water = id
+                    if expires_at is not None and expires_at <= now:
+                        continue
+                    self._revoked[jti] = expires_at
+                    if jti not in self._bloom:
+                        self._bloom.add(jti)
+                if len(rows) < batch:
+                    break
+            self._loaded = True
+            self._synced_at = time.monotonic()
+            self._prune()
+
+    def _prune(self):
+        """Drop identifiers of expired tokens from the exact set"""
+        if time.monotonic() - self._pruned_at < self.app.config['REVOCATION_PRUNE_INTERVAL']:
+            return
+        now = datetime.utcnow()
+        self._revoked = {
+            jti: expires_at for jti, expires_at in self._revoked.items()
+            if expires_at is None or expires_at > now
+        }
+        self._pruned_at = time.monotonic()
+
+    def add(self, jti, expires_at=None):
+        """Record a token revoked by this worker without waiting for a sync"""
+        self.bloom.add(jti)
+        self._revoked[jti] = expires_at
+
+    def is_revoked(self, jti):
+        self.bloom  # opens the filter in this process
+        if not self._loaded or time.monotonic() - self._synced_at >= self.app.config['REVOCATION_SYNC_INTERVAL']:
+            self.sync()
+        if jti not in self._bloom:
+            return False
+        if jti in self._revoked:
+            return True
+        # Either revoked by another worker since our last sync, or a
+        # bloom filter false positive; the incremental sync settles it.
+        self.sync()
+        return jti in self._revoked
+
+    def stats(self):
+        return {
+            'pid': self._pid,
+            'revoked': len(self._revoked),
+            'high_water': self._high_water,
+            'synced_seconds_ago': round(time.monotonic() - self._synced_at, 1) if self._loaded else None,
+            'built_at': self._bloom.built_at if self._bloom is not None else None,
+        }
+
+
+revocation_index = RevocationIndex()
+
+
+class TokenGenerations:
+    """Per-process cache of each user's current token generation
+
+    Tokens carry the generation they were issued under; bumping the user's
+    generation revokes every older token in one write. Lookups are cached
+    for `TOKEN_GENERATION_CACHE_TTL` seconds, which bounds how long another
+    worker keeps accepting tokens after a bump, and at most
+    `TOKEN_GENERATION_CACHE_SIZE` users are kept per process.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self._generations = LRUCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('TOKEN_GENERATION_CACHE_SIZE', 10000)
+        app.config.setdefault('TOKEN_GENERATION_CACHE_TTL', 30)
+        self._generations = LRUCache(app.config['TOKEN_GENERATION_CACHE_SIZE'],
+                                     app.config['TOKEN_GENERATION_CACHE_TTL'])
+
+    def get(self, identity):
+        generation = self._generations.get(identity)
+        if generation is not None:
+            return generation
+
+        from src.models.users import UserModel
+        generation = UserModel.query \
+            .with_entities(UserModel.token_generation) \
+            .filter(UserModel.email == identity) \
+            .scalar()
+        self.set(identity, generation)
+        return generation
+
+    def set(self, identity, generation):
+        self._generations.set(identity, generation)
+
+    def invalidate(self, identity):
+        self._generations.delete(identity)
+
+    def is_stale(self, identity, claims):
+        """True when the token was issued before the user's latest revocation"""
+        generation = self.get(identity)
+        if generation is None:
+            return True
+        return claims.get('token_generation', 0) < generation
+
+
+token_generations = TokenGenerations()
@@ -0,0 +1,295 @@
+"""Lightweight span tracing for requests and Celery tasks
+
+A trace starts at each incoming request or Celery task and is sampled
+there, once: `TRACING_SAMPLE_RATE` of new traces are kept, and tasks
+carrying a W3C `traceparent` follow the caller's decision. Requests follow
+it only with `TRACING_TRUST_TRACEPARENT`, as any client can send a sampled
+header; otherwise they join the caller's trace but are sampled here. Only
+sampled traces create spans, so unsampled work pays for a context variable
+lookup and nothing else. Spans of a trace are buffered and exported
+together when its root span ends, by default as JSON lines to a rotating
+file per process (`TRACING_FILE`), or to any callable named by
+`TRACING_EXPORTER` that takes a list of span dicts.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from importlib import import_module
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_current_span = ContextVar('current_span', default=None)
+_publish_span = ContextVar('publish_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'trace', 'span_id', 'parent_id', 'started', 'duration', 'attributes', 'error')
+
+    def __init__(self, name, trace, parent_id, attributes):
+        self.name = name
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.started = time.time()
+        self.duration = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def finish(self, error=None):
+        self.duration = time.time() - self.started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.started,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+            'pid': os.getpid(),
+        }
+
+
+class Trace:
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans = []
+
+
+class FileExporter:
+    """Writes spans as JSON lines to a size-rotated file per process"""
+
+    def __init__(self, path, max_bytes, backup_count):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._handler = None
+        self._pid = None
+
+    def __call__(self, spans):
+        if self._pid != os.getpid():
+            root, ext = os.path.splitext(self.path)
+            os.makedirs(os.path.dirname(root) or '.', exist_ok=True)
+            self._handler = logging.handlers.RotatingFileHandler(
+                f"{root}.{os.getpid()}{ext}", maxBytes=self.max_bytes, backupCount=self.backup_count
+            )
+            self._pid = os.getpid()
+        for span in spans:
+            self._handler.emit(logging.makeLogRecord({'msg': json.dumps(span, default=str)}))
+
+
+def parse_traceparent(header):
+    """(trace_id, parent_id, sampled) from a W3C traceparent header, or None"""
+    try:
+        version, trace_id, parent_id, flags = header.split('-')
+        int(trace_id, 16), int(parent_id, 16)
+        return trace_id, parent_id, bool(int(flags, 16) & 1)
+    except (AttributeError, ValueError):
+        return None
+
+
+class Tracer:
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = False
+        self.exporter = None
+        self._instrumented = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('TRACING_ENABLED', False)
+        app.config.setdefault('TRACING_SAMPLE_RATE', 0.01)
+        app.config.setdefault('TRACING_TRUST_TRACEPARENT', False)
+        app.config.setdefault('TRACING_FILE', '/tmp/flapisk-traces/traces.jsonl')
+        app.config.setdefault('TRACING_FILE_MAX_BYTES', 50 * 1024 * 1024)
+        app.config.setdefault('TRACING_FILE_BACKUP_COUNT', 3)
+        app.config.setdefault('TRACING_EXPORTER', None)
+        app.config.setdefault('TRACING_MAX_STATEMENT_LENGTH', 500)
+        self.enabled = app.config['TRACING_ENABLED']
+        if not self.enabled:
+            return
+
+        exporter = app.config['TRACING_EXPORTER']
+        if exporter:
+            module, _, name = exporter.partition(':')
+            self.exporter = getattr(import_module(module), name)
+        else:
+            self.exporter = FileExporter(
+                app.config['TRACING_FILE'],
+                app.config['TRACING_FILE_MAX_BYTES'],
+                app.config['TRACING_FILE_BACKUP_COUNT']
+            )
+
+        if not self._instrumented:
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+            event.listen(Engine, 'handle_error', self._execute_failed)
+            self._instrumented = True
+        app.before_request(self._start_request)
+        app.after_request(self._tag_response)
+        app.teardown_request(self._finish_request)
+
+    def init_celery(self, celery):
+        """Carry trace context into task headers and trace task execution"""
+        from celery import signals
+        signals.before_task_publish.connect(self._inject_headers, weak=False)
+        signals.after_task_publish.connect(self._published, weak=False)
+        signals.task_prerun.connect(self._start_task, weak=False)
+        signals.task_postrun.connect(self._finish_task, weak=False)
+
+    def _sampled(self, traceparent, trusted):
+        trace_id, parent_id, sampled = parse_traceparent(traceparent) or (None, None, None)
+        if trusted and sampled is not None:
+            return trace_id, parent_id, sampled
+        return trace_id, parent_id, random.random() < self.app.config['TRACING_SAMPLE_RATE']
+
+    def start_trace(self, name, traceparent=None, trusted=True, **attributes):
+        """Start a root span, or return None when the trace is not sampled
+
+        The sampled flag of an untrusted `traceparent` is ignored.
+        """
+        trace_id, parent_id, sampled = self._sampled(traceparent, trusted)
+        if not sampled:
+            return None
+        span = Span(name, Trace(trace_id), parent_id, attributes)
+        return span, _current_span.set(span)
+
+    def finish_trace(self, started, error=None):
+        span, token = started
+        span.finish(error)
+        _current_span.reset(token)
+        span.trace.spans.append(span)
+        try:
+            self.exporter([s.to_dict() for s in span.trace.spans])
+        except Exception as e:
+            logger.warning("Trace export failed: %s", e)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = Span(name, parent.trace, parent.span_id, attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            span.finish(error)
+            _current_span.reset(token)
+            parent.trace.spans.append(span)
+
+    def trace_resource(self, view):
+        """ApiRouter decorator adding a span per resource call"""
+        resource = getattr(view, 'view_class', view).__name__
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with self.span(f"resource {resource}.{request.method.lower()}"):
+                return view(*args, **kwargs)
+        return wrapper
+
+    def _start_request(self):
+        g.trace = self.start_trace(
+            f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+            request.headers.get('traceparent'),
+            trusted=self.app.config['TRACING_TRUST_TRACEPARENT'],
+            path=request.path,
+            method=request.method
+        )
+
+    def _tag_response(self, response):
+        started = g.get('trace')
+        if started is not None:
+            started[0].attributes['status'] = response.status_code
+            response.headers['traceresponse'] = started[0].traceparent
+        return response
+
+    def _finish_request(self, exc):
+        started = g.pop('trace', None)
+        if started is not None:
+            self.finish_trace(started, exc)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        limit = self.app.config['TRACING_MAX_STATEMENT_LENGTH']
+        context._trace_span = Span('db.query', parent.trace, parent.span_id, {
+            'statement': statement[:limit],
+            'executemany': executemany,
+        })
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, '_trace_span', None)
+        if span is not None:
+            span.finish()
+            span.trace.spans.append(span)
+            context._trace_span = None
+
+    @staticmethod
+    def _execute_failed(exception_context):
+        span = getattr(exception_context.execution_context, '_trace_span', None)
+        if span is not None:
+            span.finish(exception_context.original_exception)
+            span.trace.spans.append(span)
+            exception_context.execution_context._trace_span = None
+
+    def _inject_headers(self, sender=None, headers=None, **kwargs):
+        parent = _current_span.get()
+        if parent is None or headers is None:
+            return
+        span = Span('celery.publish', parent.trace, parent.span_id, {'task': sender})
+        headers['traceparent'] = span.traceparent
+        _publish_span.set(span)
+
+    @staticmethod
+    def _published(**kwargs):
+        span = _publish_span.get()
+        if span is not None:
+            span.finish()
+            span.trace.spans.append(span)
+            _publish_span.set(None)
+
+    def _start_task(self, task_id=None, task=None, **kwargs):
+        task.request.trace = self.start_trace(
+            f"task {task.name}",
+            task.request.get('traceparent'),
+            task_id=task_id
+        )
+
+    def _finish_task(self, task_id=None, task=None, state=None, **kwargs):
+        started = getattr(task.request, 'trace', None)
+        if started is not None:
+            started[0].attributes['state'] = state
+            self.finish_trace(started)
+            task.request.trace = None
+
+
+tracer = Tracer()
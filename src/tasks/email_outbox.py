@@ -0,0 +1,91 @@
+"""Delivery of queued emails from the email outbox
+
+Pending rows are claimed in batches with SELECT ... FOR UPDATE SKIP LOCKED,
+so several workers can drain the outbox side by side. Failed sends are
+retried with exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS, and rows
+left in `sending` by a crashed worker are reclaimed after
+EMAIL_OUTBOX_CLAIM_TIMEOUT seconds.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from app import app, celery
+from src.models.email_outbox import EmailOutboxModel, EmailStatus
+from src.services.db import db
+from src.utils.email import send_outbox_emails
+
+logger = logging.getLogger(__name__)
+
+
+def claim_batch(now, batch_size):
+    stale = now - timedelta(seconds=app.config['EMAIL_OUTBOX_CLAIM_TIMEOUT'])
+    emails = EmailOutboxModel.query \
+        .filter(or_(
+            and_(EmailOutboxModel.status == EmailStatus.PENDING, EmailOutboxModel.next_attempt_at <= now),
+            and_(EmailOutboxModel.status == EmailStatus.SENDING, EmailOutboxModel.claimed_at < stale),
+        )) \
+        .order_by(EmailOutboxModel.next_attempt_at) \
+        .limit(batch_size) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    for email in emails:
+        email.status = EmailStatus.SENDING
+        email.claimed_at = now
+    db.session.commit()
+    return emails
+
+
+def retry_delay(attempts):
+    base = app.config['EMAIL_OUTBOX_RETRY_BACKOFF']
+    return min(base * 2 ** (attempts - 1), app.config['EMAIL_OUTBOX_RETRY_BACKOFF_MAX'])
+
+
+def record_delivery(email, error):
+    """Record the outcome of one send attempt on the claimed row"""
+    email.attempts += 1
+    if error is not None:
+        email.last_error = str(error)
+        if email.attempts >= app.config['EMAIL_OUTBOX_MAX_ATTEMPTS']:
+            email.status = EmailStatus.FAILED
+        else:
+            email.status = EmailStatus.PENDING
+            email.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(email.attempts))
+        return email.status
+
+    email.status = EmailStatus.SENT
+    email.sent_at = datetime.utcnow()
+    email.last_error = None
+    return email.status
+
+
+@celery.task()
+def drain_email_outbox():
+    result = {'sent': 0, 'retried': 0, 'failed': 0}
+    batch_size = app.config['EMAIL_OUTBOX_BATCH_SIZE']
+    with app.app_context():
+        try:
+            for _ in range(app.config['EMAIL_OUTBOX_MAX_BATCHES']):
+                emails = claim_batch(datetime.utcnow(), batch_size)
+                errors = send_outbox_emails(emails)
+                for email, error in zip(emails, errors):
+                    status = record_delivery(email, error)
+                    if status == EmailStatus.SENT:
+                        result['sent'] += 1
+                    elif status == EmailStatus.FAILED:
+                        result['failed'] += 1
+                    else:
+                        result['retried'] += 1
+                db.session.commit()
+                if len(emails) < batch_size:
+                    break
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+    if any(result.values()):
+        logger.info("Email outbox: %(sent)d sent, %(retried)d to retry, %(failed)d failed", result)
+    return result
@@ -0,0 +1,138 @@
+"""Periodic maintenance of the hot tables
+
+Expired revoked tokens, stale unverified sign-ups and old sent emails are
+deleted in small batches of primary keys, selected through an index and
+committed one batch at a time with a pause in between, so the prune never
+holds long InnoDB locks or a large undo log.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+
+from app import app, celery
+from src.services.cache import user_cache
+from src.services.db import db
+from src.services.revocation import token_generations
+
+logger = logging.getLogger(__name__)
+
+
+def delete_in_batches(model, filters, order_by, batch_size, pause, columns=(), on_deleted=None):
+    """Delete rows matching `filters` in index-ordered batches of primary keys
+
+    `on_deleted` is called after each committed batch with its rows: the id
+    plus any extra `columns`, read before the delete.
+    """
+    deleted = 0
+    while True:
+        rows = model.query \
+            .with_entities(model.id, *columns) \
+            .filter(*filters) \
+            .order_by(order_by) \
+            .limit(batch_size) \
+            .all()
+        if not rows:
+            break
+
+        ids = [row.id for row in rows]
+        model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        if on_deleted is not None:
+            on_deleted(rows)
+        deleted += len(ids)
+
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+    return deleted
+
+
+def token_lifetime():
+    """Longest lifetime of an issued token, or None when some never expire"""
+    lifetimes = [app.config['JWT_ACCESS_TOKEN_EXPIRES'], app.config['JWT_REFRESH_TOKEN_EXPIRES']]
+    if any(lifetime is False for lifetime in lifetimes):
+        return None
+    return max(
+        lifetime if isinstance(lifetime, timedelta) else timedelta(seconds=lifetime)
+        for lifetime in lifetimes
+    )
+
+
+def prune_revoked_tokens(now, batch_size, pause):
+    from src.models.revoked_tokens import RevokedTokenModel
+    deleted = delete_in_batches(
+        RevokedTokenModel,
+        [RevokedTokenModel.expires_at < now],
+        RevokedTokenModel.expires_at,
+        batch_size,
+        pause
+    )
+
+    # Rows without an expiry (revoked before it was recorded, or tokens
+    # without `exp`) go once any token revoked then must have expired.
+    lifetime = token_lifetime()
+    if lifetime is not None:
+        deleted += delete_in_batches(
+            RevokedTokenModel,
+            [RevokedTokenModel.expires_at.is_(None), RevokedTokenModel.created_at < now - lifetime],
+            RevokedTokenModel.id,
+            batch_size,
+            pause
+        )
+    return deleted
+
+
+def evict_pruned_users(rows):
+    # Bulk deletes bypass ORM events, so evict pruned users here.
+    for id, email in rows:
+        user_cache.evict(id, [email])
+        token_generations.invalidate(email)
+
+
+def prune_unverified_users(now, batch_size, pause):
+    from src.models.users import UserModel
+    cutoff = now - timedelta(seconds=app.config['UNVERIFIED_USER_TTL'])
+    return delete_in_batches(
+        UserModel,
+        [UserModel.verified == False, UserModel.created_at < cutoff],
+        UserModel.created_at,
+        batch_size,
+        pause,
+        columns=[UserModel.email],
+        on_deleted=evict_pruned_users
+    )
+
+
+def prune_sent_emails(now, batch_size, pause):
+    from src.models.email_outbox import EmailOutboxModel, EmailStatus
+    cutoff = now - timedelta(seconds=app.config['EMAIL_OUTBOX_RETENTION'])
+    return delete_in_batches(
+        EmailOutboxModel,
+        [EmailOutboxModel.status == EmailStatus.SENT, EmailOutboxModel.sent_at < cutoff],
+        EmailOutboxModel.sent_at,
+        batch_size,
+        pause
+    )
+
+
+@celery.task()
+def prune_expired():
+    with app.app_context():
+        now = datetime.utcnow()
+        batch_size = app.config['PRUNE_BATCH_SIZE']
+        pause = app.config['PRUNE_BATCH_PAUSE']
+        try:
+            result = {
+                'revoked_tokens': prune_revoked_tokens(now, batch_size, pause),
+                'unverified_users': prune_unverified_users(now, batch_size, pause),
+                'sent_emails': prune_sent_emails(now, batch_size, pause),
+            }
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+    logger.info("Pruned %(revoked_tokens)d revoked tokens, %(unverified_users)d unverified users "
+                "and %(sent_emails)d sent emails", result)
+    return result
@@ -1,14 +1,71 @@
-from flask import make_response
+import hashlib
+
+from flask import Response, request
+
+from src.utils.serializer import dumps, serialize
+
+
+def json_response(payload, status, etag=None):
+    response = Response(dumps(payload), status=status, mimetype='application/json')
+    if etag is not None:
+        response.set_etag(etag)
+    return response
 
 
 class APIResponse:
     @staticmethod
-    def success_200(data):
+    def entity_etag(id, updated_at):
+        """Strong ETag for one row, derived from its id and last update time"""
+        version = f"{id}:{updated_at.isoformat() if updated_at else ''}"
+        return hashlib.blake2b(version.encode('utf-8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def collection_etag(versions, *extra):
+        """Strong ETag for a list of (id, updated_at) rows plus any page parameters"""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in extra:
+            digest.update(f"{part};".encode('utf-8'))
+        for id, updated_at in versions:
+            digest.update(f"{id}:{updated_at.isoformat() if updated_at else ''};".encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def is_not_modified(etag):
+        return etag is not None and request.if_none_match.contains(etag)
+
+    @staticmethod
+    def is_precondition_failed(etag):
+        """True when the request carries If-Match and none of its tags match"""
+        return bool(request.if_match) and not request.if_match.contains(etag)
+
+    @staticmethod
+    def not_modified_304(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    @staticmethod
+    def success_200(data, schema=None, many=False, etag=None):
+        if schema is not None:
+            data = serialize(data, schema, many=many)
         response = {
             'error': False,
             'data': data
         }
-        return make_response(response, 200)
+        return json_response(response, 200, etag)
+
+    @staticmethod
+    def paginated_200(data, next_cursor, count=None, schema=None, etag=None):
+        if schema is not None:
+            data = serialize(data, schema, many=True)
+        response = {
+            'error': False,
+            'data': data,
+            'next': next_cursor
+        }
+        if count is not None:
+            response['count'] = count
+        return json_response(response, 200, etag)
 
     @staticmethod
     def success_201(data):
@@ -16,7 +73,7 @@ class APIResponse:
             'error': False,
             'data': data
         }
-        return make_response(response, 201)
+        return json_response(response, 201)
 
     @staticmethod
     def success_204(data):
@@ -24,7 +81,7 @@ class APIResponse:
             'error': False,
             'data': data
         }
-        return make_response(response, 204)
+        return json_response(response, 204)
 
     @staticmethod
     def error_400(error=None):
@@ -32,7 +89,7 @@ class APIResponse:
             'error': True,
             'message': 'Bad request' if error is None else error
         }
-        return make_response(response, 400)
+        return json_response(response, 400)
 
     @staticmethod
     def error_401(error=None):
@@ -40,7 +97,7 @@ class APIResponse:
             'error': True,
             'message': 'Unauthorized' if error is None else error
         }
-        return make_response(response, 401)
+        return json_response(response, 401)
 
     @staticmethod
     def error_403(error=None):
@@ -48,7 +105,7 @@ class APIResponse:
             'error': True,
             'message': 'Forbidden' if error is None else error
         }
-        return make_response(response, 403)
+        return json_response(response, 403)
 
     @staticmethod
     def error_404(error=None):
@@ -56,7 +113,7 @@ class APIResponse:
             'error': True,
             'message': 'Entity not exist' if error is None else error
         }
-        return make_response(response, 404)
+        return json_response(response, 404)
 
     @staticmethod
     def error_409(error=None):
@@ -64,7 +121,15 @@ class APIResponse:
             'error': True,
             'message': 'Conflict' if error is None else error
         }
-        return make_response(response, 409)
+        return json_response(response, 409)
+
+    @staticmethod
+    def error_412(error=None):
+        response = {
+            'error': True,
+            'message': 'Precondition failed' if error is None else error
+        }
+        return json_response(response, 412)
 
     @staticmethod
     def error_500(error=None):
@@ -72,4 +137,14 @@ class APIResponse:
             'error': True,
             'message': 'Internal server error' if error is None else error
         }
-        return make_response(response, 500)
+        return json_response(response, 500)
+
+    @staticmethod
+    def error_503(error=None, retry_after=1):
+        response = {
+            'error': True,
+            'message': 'Service unavailable' if error is None else error
+        }
+        response = json_response(response, 503)
+        response.headers['Retry-After'] = str(retry_after)
+        return response
@@ -0,0 +1,188 @@
+"""Batched create/update/deactivate/delete of many users in one transaction
+
+Existing rows are looked up with chunked `IN (...)` queries, passwords are
+hashed through the hashing pool in one go, and the writes are issued as
+bulk inserts, bulk updates and single UPDATE/DELETE statements per
+operation type, followed by one commit. Each operation gets its own entry
+in the result list; a failure while writing rolls the whole batch back.
+"""
+from datetime import datetime
+
+from marshmallow import ValidationError
+
+from src.models.users import UserModel, UserRole
+from src.schemas.users import bulk_user_operation_schema
+from src.services.cache import user_cache
+from src.services.db import db, unit_of_work
+from src.services.revocation import token_generations
+from src.utils.hash import generate_hashes
+
+IN_CHUNK_SIZE = 1000
+UPDATE_FIELDS = ('email', 'role', 'first_name', 'last_name', 'phone_number', 'verified')
+
+
+def chunked(items, size=IN_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def lookup_by_ids(ids):
+    found = {}
+    for chunk in chunked(ids):
+        rows = UserModel.query \
+            .with_entities(UserModel.id, UserModel.email, UserModel.active) \
+            .filter(UserModel.id.in_(chunk))
+        found.update({row.id: row for row in rows})
+    return found
+
+
+def lookup_by_emails(emails):
+    found = {}
+    for chunk in chunked(emails):
+        rows = UserModel.query \
+            .with_entities(UserModel.id, UserModel.email) \
+            .filter(UserModel.email.in_(chunk))
+        found.update({row.email: row.id for row in rows})
+    return found
+
+
+class BulkUserOperations:
+    def __init__(self, operations):
+        self.operations = operations
+        self.results = [None] * len(operations)
+        self.accepted = []
+
+    def fail(self, index, op, message):
+        self.results[index] = {'index': index, 'op': op, 'status': 'error', 'message': message}
+
+    def succeed(self, index, op, id):
+        self.results[index] = {'index': index, 'op': op, 'id': id, 'status': 'ok'}
+
+    def validate(self):
+        loaded = []
+        for index, raw in enumerate(self.operations):
+            try:
+                loaded.append((index, bulk_user_operation_schema.load(raw)))
+            except ValidationError as e:
+                self.fail(index, raw.get('op') if isinstance(raw, dict) else None, e.messages)
+
+        existing = lookup_by_ids({op['id'] for _, op in loaded if 'id' in op})
+        emails = lookup_by_emails({op['email'] for _, op in loaded if 'email' in op})
+
+        seen_ids, seen_emails = set(), set()
+        for index, op in loaded:
+            kind = op['op']
+            if kind == 'create':
+                if op['email'] in emails or op['email'] in seen_emails:
+                    self.fail(index, kind, "Email already exist.")
+                    continue
+            else:
+                row = existing.get(op['id'])
+                if row is None or (kind != 'delete' and not row.active):
+                    self.fail(index, kind, "Entity not exist")
+                    continue
+                if op['id'] in seen_ids:
+                    self.fail(index, kind, "Duplicate operation for user.")
+                    continue
+                if 'email' in op and op['email'] != row.email and \
+                        (op['email'] in emails or op['email'] in seen_emails):
+                    self.fail(index, kind, "Email already exist.")
+                    continue
+                op['previous_email'] = row.email
+                seen_ids.add(op['id'])
+            if 'email' in op:
+                seen_emails.add(op['email'])
+            self.accepted.append((index, op))
+
+    def apply(self):
+        now = datetime.utcnow()
+        by_kind = {'create': [], 'update': [], 'deactivate': [], 'delete': []}
+        for index, op in self.accepted:
+            by_kind[op['op']].append((index, op))
+
+        with_password = [op for _, op in by_kind['create'] + by_kind['update'] if 'password' in op]
+        for op, password_hash in zip(with_password, generate_hashes([op['password'] for op in with_password])):
+            op['password'] = password_hash
+
+        with unit_of_work():
+            self._create(by_kind['create'], now)
+            self._update(by_kind['update'], now)
+            self._deactivate(by_kind['deactivate'], now)
+            self._delete(by_kind['delete'])
+
+        # Bulk statements bypass ORM events, so evict touched users here.
+        for _, op in self.accepted:
+            emails = {op.get('email'), op.get('previous_email')}
+            user_cache.evict(op.get('id'), emails)
+            for email in emails:
+                if email:
+                    token_generations.invalidate(email)
+
+        created = lookup_by_emails([op['email'] for _, op in by_kind['create']])
+        for index, op in self.accepted:
+            self.succeed(index, op['op'], created.get(op['email']) if op['op'] == 'create' else op['id'])
+
+    def _create(self, operations, now):
+        rows = []
+        for _, op in operations:
+            verified = op.get('verified', False)
+            rows.append({
+                'email': op['email'],
+                'password': op['password'],
+                'role': UserRole.role(op.get('role', UserRole.USER.value)),
+                'first_name': op.get('first_name'),
+                'last_name': op.get('last_name'),
+                'phone_number': op.get('phone_number'),
+                'verified': verified,
+                'verified_at': now if verified else None,
+                'active': True,
+                'token_generation': 0,
+                'created_at': now,
+                'updated_at': now,
+            })
+        if rows:
+            db.session.bulk_insert_mappings(UserModel, rows)
+
+    def _update(self, operations, now):
+        rows = []
+        password_changed = []
+        for _, op in operations:
+            row = {'id': op['id'], 'updated_at': now}
+            for field in UPDATE_FIELDS:
+                if field in op:
+                    row[field] = UserRole.role(op[field]) if field == 'role' else op[field]
+            if 'password' in op:
+                row['password'] = op['password']
+                password_changed.append(op['id'])
+            rows.append(row)
+        if rows:
+            db.session.bulk_update_mappings(UserModel, rows)
+        for chunk in chunked(password_changed):
+            UserModel.query.filter(UserModel.id.in_(chunk)).update(
+                {UserModel.token_generation: UserModel.token_generation + 1},
+                synchronize_session=False
+            )
+
+    def _deactivate(self, operations, now):
+        for chunk in chunked(op['id'] for _, op in operations):
+            UserModel.query.filter(UserModel.id.in_(chunk)).update({
+                UserModel.active: False,
+                UserModel.token_generation: UserModel.token_generation + 1,
+                UserModel.updated_at: now,
+            }, synchronize_session=False)
+
+    def _delete(self, operations):
+        for chunk in chunked(op['id'] for _, op in operations):
+            UserModel.query.filter(UserModel.id.in_(chunk)).delete(synchronize_session=False)
+
+    def summary(self):
+        ok = sum(1 for result in self.results if result['status'] == 'ok')
+        return {'total': len(self.results), 'succeeded': ok, 'failed': len(self.results) - ok}
+
+
+def run_bulk_operations(operations):
+    bulk = BulkUserOperations(operations)
+    bulk.validate()
+    bulk.apply()
+    return {'results': bulk.results, 'summary': bulk.summary()}
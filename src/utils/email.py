@@ -1,44 +1,44 @@
-import os
-import jinja2
-import boto3
-from botocore.exceptions import ClientError
-
-from flask import current_app as app
-
-
-def send_email_ses(ToAddresses, Source, Message):
-    if 'AWS_EXECUTION_ENV' in os.environ:
-        client = boto3.client('ses')
-    else:
-        client = boto3.client(
-            'ses',
-            region_name=app.config['AWS_REGION'],
-            aws_access_key_id=app.config['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=app.config['AWS_SECRET_ACCESS_KEY']
-        )
-
-    # Provide the contents of the email.
-    response = client.send_email(
-        Destination={'ToAddresses': ToAddresses},
-        Source=Source,
-        Message=Message,
+from src.models.email_outbox import EmailOutboxModel
+from src.services.mailer import mailer
+
+REGISTRATION_TEMPLATE = 'registration'
+REGISTRATION_SUBJECT = 'Email confirmation'
+
+
+def queue_registration_email(reg_data, verify_token):
+    """Queue the registration email in the outbox within the current transaction"""
+    return EmailOutboxModel.enqueue(
+        reg_data['email'],
+        REGISTRATION_TEMPLATE,
+        reg_data=reg_data,
+        token=verify_token
     )
 
 
-def send_registration_email(reg_data, verify_token):
-    subject = 'Email confirmation'
-    template_loader = jinja2.FileSystemLoader(searchpath=app.config['TEMPLATES_DIR'])
-    template_env = jinja2.Environment(loader=template_loader)
-    template = template_env.get_template("registration.html")
-    html_content = template.render(reg_data=reg_data, token=verify_token)
+def send_outbox_emails(emails):
+    """Send claimed outbox rows; returns the error for each row, or None when sent
 
-    Message = {
-        'Body': {'Html': {'Charset': "UTF-8", 'Data': html_content}},
-        'Subject': {'Charset': "UTF-8", 'Data': subject},
-    }
+    Rows are grouped by template so each group renders and sends through
+    a single batch call on the mailer.
+    """
+    errors = {}
+    groups = {}
+    for email in emails:
+        groups.setdefault(email.template, []).append(email)
 
-    send_email_ses(
-        [reg_data['email']],
-        app.config['SERVICE_EMAIL'],
-        Message
-    )
+    for template, group in groups.items():
+        if template != REGISTRATION_TEMPLATE:
+            for email in group:
+                errors[email.id] = ValueError(f"Unknown email template: {template}")
+            continue
+
+        recipients = []
+        for email in group:
+            context = email.load_context()
+            recipients.append((email.recipient, {'reg_data': context['reg_data'], 'token': context['token']}))
+
+        results = mailer.send_batch("registration.html", REGISTRATION_SUBJECT, recipients)
+        for email, (_, response) in zip(group, results):
+            errors[email.id] = response if isinstance(response, Exception) else None
+
+    return [errors[email.id] for email in emails]
@@ -0,0 +1,46 @@
+"""Streaming serialisers for bulk exports
+
+Rows are read through a server-side cursor in `batch_size` chunks and
+written out one at a time, so memory stays flat however large the table.
+"""
+import csv
+import io
+
+from src.utils.serializer import dumps, get_serializer
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def stream_query(query, batch_size):
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def iter_ndjson(rows, schema):
+    serializer = get_serializer(type(schema))
+    for row in rows:
+        yield dumps(serializer(row)) + b'\n'
+
+
+def iter_csv(rows, schema):
+    columns = list(schema.opts.fields or schema.fields)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+
+    serializer = get_serializer(type(schema))
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(serializer(row))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_export(query, schema, export_format, batch_size):
+    rows = stream_query(query, batch_size)
+    if export_format == 'csv':
+        return iter_csv(rows, schema)
+    return iter_ndjson(rows, schema)
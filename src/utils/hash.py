@@ -1,13 +1,117 @@
-from passlib.hash import pbkdf2_sha256 as sha256
+import logging
 import string, secrets
+import threading
+import time
+
+from passlib.context import CryptContext
+from passlib.hash import pbkdf2_sha256 as sha256
+
+from src.services.hasher import hasher
+
+logger = logging.getLogger(__name__)
+
+# Schemes we accept for stored hashes; the first one is used for new hashes
+# and anything else is rehashed on the next successful sign in.
+HASH_SCHEMES = ['pbkdf2_sha256']
+
+pwd_context = CryptContext(schemes=HASH_SCHEMES, deprecated='auto')
+
+# App whose hashing cost is calibrated on the first hash instead of at startup
+_deferred_app = None
+_deferred_lock = threading.Lock()
+
+
+def calibrate_rounds(target_seconds, probe_rounds=10000, samples=3):
+    """PBKDF2 rounds that take about `target_seconds` to verify on this machine"""
+    handler = sha256.using(rounds=probe_rounds)
+    elapsed = min(_time_hash(handler) for _ in range(samples))
+    rounds = int(probe_rounds * target_seconds / elapsed)
+    # Round coarsely so workers calibrating on the same host agree.
+    return max(1000, round(rounds, -3))
+
+
+def _time_hash(handler):
+    started = time.perf_counter()
+    handler.hash('calibration')
+    return time.perf_counter() - started
+
+
+def configure_hashing(app, defer=False):
+    """Set the PBKDF2 cost for this process from config or by calibration
+
+    Pool processes are forked after this runs and inherit the context. With
+    `defer`, calibration waits for the first hash, keeping it off cold
+    starts that never hash a password.
+    """
+    global _deferred_app
+    rounds = app.config.get('HASH_ROUNDS')
+    if defer and not rounds:
+        _deferred_app = app
+        return None
+
+    _deferred_app = None
+    if rounds:
+        rounds = int(rounds)
+    else:
+        target = app.config['HASH_TARGET_VERIFY_MS'] / 1000
+        rounds = max(calibrate_rounds(target), app.config['HASH_MIN_ROUNDS'])
+
+    tolerance = app.config['HASH_ROUNDS_TOLERANCE']
+    pwd_context.update(
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=int(rounds * (1 - tolerance)),
+        pbkdf2_sha256__max_rounds=int(rounds * (1 + tolerance)),
+    )
+    logger.info("Password hashing configured with %d pbkdf2_sha256 rounds", rounds)
+    return rounds
+
+
+def ensure_hashing_configured():
+    """Run a calibration deferred by `configure_hashing`, once per process
+
+    Called before work is handed to the pool, so pool processes forked
+    afterwards inherit the calibrated context.
+    """
+    if _deferred_app is not None:
+        with _deferred_lock:
+            if _deferred_app is not None:
+                configure_hashing(_deferred_app)
+
+
+def compute_hash(password):
+    ensure_hashing_configured()
+    return pwd_context.hash(password)
+
+
+def check_hash(password, phrase):
+    ensure_hashing_configured()
+    return pwd_context.verify(password, phrase)
+
+
+def check_and_update_hash(password, phrase):
+    ensure_hashing_configured()
+    return pwd_context.verify_and_update(password, phrase)
 
 
 def generate_hash(password):
-    return sha256.hash(password)
+    ensure_hashing_configured()
+    return hasher.run('generate_hash', compute_hash, password)
+
+
+def generate_hashes(passwords):
+    ensure_hashing_configured()
+    return hasher.map('generate_hash', compute_hash, passwords)
 
 
 def verify_hash(password, phrase):
-    return sha256.verify(password, phrase)
+    ensure_hashing_configured()
+    return hasher.run('verify_hash', check_hash, password, phrase)
+
+
+def verify_and_rehash(password, phrase):
+    """Verify a password; also returns a new hash when the stored one is stale"""
+    ensure_hashing_configured()
+    return hasher.run('verify_hash', check_and_update_hash, password, phrase)
 
 
 def generate_password(length):
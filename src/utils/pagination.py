@@ -0,0 +1,47 @@
+import base64
+import json
+import time
+
+_count_cache = {}
+
+
+def encode_cursor(last_id):
+    payload = json.dumps({'id': last_id}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the id a cursor points after; plain integer ids are accepted too"""
+    if cursor is None or cursor == '':
+        return None
+    if cursor.isdigit():
+        return int(cursor)
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))['id'])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def parse_limit(value, default, maximum):
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError("Invalid limit!")
+    return min(limit, maximum)
+
+
+def cached_count(key, query, ttl):
+    """Row count of `query`, recomputed at most once per `ttl` seconds per process"""
+    entry = _count_cache.get(key)
+    now = time.monotonic()
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    count = query.order_by(None).count()
+    _count_cache[key] = (count, now + ttl)
+    return count
@@ -0,0 +1,24 @@
+from functools import wraps
+
+from flask_jwt_extended import get_jwt_identity
+
+from src.models.users import UserModel, UserRole
+from src.utils.api_response import APIResponse
+
+
+def admin_required(fn):
+    """Allow the request only for an active Admin; use below @jwt_required
+
+    The role is read from the primary, never from the user cache, so a
+    demoted or deactivated Admin loses access straight away.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        user = UserModel.query \
+            .with_entities(UserModel.role, UserModel.active) \
+            .filter(UserModel.email == get_jwt_identity()) \
+            .first()
+        if user is None or not user.active or user.role != UserRole.ADMIN:
+            return APIResponse.error_403("Admin role required!")
+        return fn(*args, **kwargs)
+    return wrapper
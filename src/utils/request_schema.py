@@ -0,0 +1,31 @@
+from functools import wraps
+
+from flask import request
+from marshmallow import ValidationError
+
+from src.utils.api_response import APIResponse
+
+
+def use_schema(schema):
+    """Load the JSON body through `schema` and pass the result as `data`
+
+    The schema instance is built once at import time; validation errors
+    come back as a 400 with the first message for each field.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            payload = request.get_json(silent=True)
+            try:
+                data = schema.load(payload if payload is not None else {})
+            except ValidationError as e:
+                messages = e.messages
+                if isinstance(messages, dict):
+                    messages = {
+                        field: errors[0] if isinstance(errors, list) and errors else errors
+                        for field, errors in messages.items()
+                    }
+                return APIResponse.error_400(messages)
+            return fn(*args, data=data, **kwargs)
+        return wrapper
+    return decorator
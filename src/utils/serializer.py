@@ -0,0 +1,80 @@
+"""Precompiled serializers and a single-pass JSON encoder for responses
+
+`get_serializer(UserSchema)` turns a marshmallow schema into a plain
+function from object to dict, built once per schema class. Fields that
+simply copy an attribute become attribute reads, enum fields read the
+member's value or name directly, and anything else falls back to the
+field's own `serialize`.
+"""
+import json
+from datetime import date, datetime
+
+from marshmallow import fields
+from marshmallow_enum import EnumField
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+PLAIN_FIELDS = (fields.Inferred, fields.Raw, fields.String, fields.Integer, fields.Boolean)
+
+_serializers = {}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """Encode `payload` to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+
+def _field_getter(name, field):
+    attribute = field.attribute or name
+
+    if isinstance(field, EnumField):
+        def get_enum(obj):
+            value = getattr(obj, attribute, None)
+            if value is None:
+                return None
+            return value.value if field.by_value else value.name
+        return get_enum
+
+    if type(field) in PLAIN_FIELDS:
+        return lambda obj: getattr(obj, attribute, None)
+
+    return lambda obj: field.serialize(name, obj)
+
+
+def compile_serializer(schema_cls):
+    schema = schema_cls()
+    names = [name for name in (schema.opts.fields or schema.dump_fields) if name in schema.dump_fields]
+    getters = tuple(
+        (schema.dump_fields[name].data_key or name, _field_getter(name, schema.dump_fields[name]))
+        for name in names
+    )
+
+    def serialize(obj):
+        return {key: getter(obj) for key, getter in getters}
+
+    return serialize
+
+
+def get_serializer(schema_cls):
+    serializer = _serializers.get(schema_cls)
+    if serializer is None:
+        serializer = _serializers[schema_cls] = compile_serializer(schema_cls)
+    return serializer
+
+
+def serialize(obj, schema_cls, many=False):
+    serializer = get_serializer(schema_cls)
+    if many:
+        return [serializer(item) for item in obj]
+    return serializer(obj)